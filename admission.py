@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Admission control
+Decides whether the web worker takes on another job based on running and
+queued jobs, CPU load and free scratch space, and hands out run slots so an
+overloaded worker queues jobs or turns them away quickly instead of slowing
+every job down. Queued jobs start shortest (estimated) job first.
+"""
+
+import itertools
+import os
+import shutil
+import threading
+import time
+
+
+MAX_RUNNING_JOBS = int(os.environ.get('CEWE_MAX_RUNNING_JOBS', '2'))
+MAX_QUEUED_JOBS = int(os.environ.get('CEWE_MAX_QUEUED_JOBS', '4'))
+# 1-minute load average per CPU above which new jobs wait for running ones
+MAX_LOAD_PER_CPU = float(os.environ.get('CEWE_MAX_LOAD_PER_CPU', '1.5'))
+MIN_FREE_SCRATCH_MB = int(os.environ.get('CEWE_MIN_FREE_SCRATCH_MB', '512'))
+# Estimated seconds of queued work above which new jobs are rejected
+MAX_QUEUED_SECONDS = float(os.environ.get('CEWE_MAX_QUEUED_SECONDS', '1800'))
+DEFAULT_JOB_SECONDS = 60.0  # assumed cost of a job without an estimate
+
+QUEUE_POLL_INTERVAL = 2.0  # seconds between load re-checks while queued
+RETRY_AFTER = 30  # seconds clients are told to wait after a rejection
+
+
+def load_per_cpu():
+    """1-minute load average divided by the CPU count (0.0 where unsupported)"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+class AdmissionController:
+    def __init__(self, scratch_path=".", max_running=MAX_RUNNING_JOBS, max_queued=MAX_QUEUED_JOBS,
+                 max_load_per_cpu=MAX_LOAD_PER_CPU, min_free_scratch_mb=MIN_FREE_SCRATCH_MB,
+                 max_queued_seconds=MAX_QUEUED_SECONDS):
+        self.scratch_path = scratch_path
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.max_load_per_cpu = max_load_per_cpu
+        self.min_free_scratch = min_free_scratch_mb * 1024 * 1024
+        self.max_queued_seconds = max_queued_seconds
+        self.running = 0
+        self.queued = 0
+        # (cost, enqueued_at, seq) of every job waiting in acquire()
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def scratch_free_bytes(self):
+        try:
+            return shutil.disk_usage(self.scratch_path).free
+        except OSError:
+            return 0
+
+    def _cpu_saturated(self, load):
+        # Only our own jobs can be made to wait, so an idle worker never
+        # defers a job because of load caused by something else on the box
+        return self.running > 0 and load > self.max_load_per_cpu
+
+    def _must_wait(self, load):
+        return self.running >= self.max_running or self._cpu_saturated(load)
+
+    def _is_next(self, ticket):
+        # Shortest job first; a job's cost shrinks by the time it has waited,
+        # so a long job still gets its turn while short ones keep arriving
+        now = time.monotonic()
+        return ticket == min(self.waiting, key=lambda t: (t[0] - (now - t[1]), t[2]))
+
+    def queued_seconds(self):
+        """Estimated seconds of work waiting for a run slot"""
+        with self.condition:
+            return sum(cost for cost, _, _ in self.waiting)
+
+    def status(self, cost=None):
+        """Snapshot of load and limits; 'accepting' is False when new jobs are rejected
+
+        cost is the estimated seconds of the job asking to be admitted, if known.
+        """
+        load = load_per_cpu()
+        free = self.scratch_free_bytes()
+        with self.condition:
+            running, queued = self.running, self.queued
+            queued_seconds = sum(cost for cost, _, _ in self.waiting)
+            must_wait = self._must_wait(load)
+            cpu_saturated = self._cpu_saturated(load)
+
+        reasons = []
+        if free < self.min_free_scratch:
+            reasons.append('scratch_space_low')
+        if must_wait and queued >= self.max_queued:
+            reasons.append('queue_full')
+        if must_wait and queued_seconds + (cost or 0) > self.max_queued_seconds:
+            reasons.append('backlog_too_long')
+
+        return {
+            'accepting': not reasons,
+            'reasons': reasons,
+            'running': running,
+            'queued': queued,
+            'max_running': self.max_running,
+            'max_queued': self.max_queued,
+            'queued_seconds': round(queued_seconds, 1),
+            'max_queued_seconds': self.max_queued_seconds,
+            'load_per_cpu': round(load, 2),
+            'cpu_saturated': cpu_saturated,
+            'scratch_free_bytes': free,
+            'min_free_scratch_bytes': self.min_free_scratch,
+        }
+
+    def acquire(self, cancel_token, on_queued=None, cost=None):
+        """Block until the job may run; returns False if it was cancelled while queued
+
+        on_queued is called once if the job has to wait. cost is the job's
+        estimated seconds; of the queued jobs the cheapest one starts first.
+        """
+        unregister = cancel_token.register(self._wake)
+        ticket = (DEFAULT_JOB_SECONDS if cost is None else cost, time.monotonic(), next(self.sequence))
+        with self.condition:
+            self.queued += 1
+            self.waiting.append(ticket)
+            must_wait = self._must_wait(load_per_cpu()) or not self._is_next(ticket)
+        try:
+            if must_wait and on_queued:
+                on_queued()
+            with self.condition:
+                while not cancel_token.cancelled and (self._must_wait(load_per_cpu()) or not self._is_next(ticket)):
+                    self.condition.wait(QUEUE_POLL_INTERVAL)
+                if cancel_token.cancelled:
+                    return False
+                self.running += 1
+                return True
+        finally:
+            with self.condition:
+                self.queued -= 1
+                self.waiting.remove(ticket)
+                # The next job in line may fit into a remaining slot
+                self.condition.notify_all()
+            unregister()
+
+    def release(self):
+        """Give a run slot back and let the next queued job start"""
+        with self.condition:
+            self.running -= 1
+            self.condition.notify_all()
+
+    def _wake(self):
+        with self.condition:
+            self.condition.notify_all()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Streaming page archives
+Writes page images into a ZIP or CBZ one at a time on any writable file-like
+object. Images are stored without compression (JPEG is already compressed),
+so pages go out byte-for-byte as they were downloaded and nothing is buffered
+beyond the page being written.
+"""
+
+import shutil
+import time
+import zipfile
+
+
+ARCHIVE_FORMATS = {
+    'zip': 'application/zip',
+    'cbz': 'application/vnd.comicbook+zip',
+}
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+def page_entry_name(page_number, extension='jpg'):
+    """Archive member name of a page; zero-padded so readers sort pages correctly"""
+    return f"page_{page_number:04d}.{extension}"
+
+
+class StreamingArchiveWriter:
+    def __init__(self, stream):
+        # zipfile falls back to data descriptors on non-seekable streams,
+        # so sockets and response bodies work as well as files
+        self.zip = zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED)
+        self.pages_written = 0
+
+    def _member(self, name):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        return info
+
+    def add_page(self, page_number, data, extension='jpg'):
+        """Append one page from bytes"""
+        self.zip.writestr(self._member(page_entry_name(page_number, extension)), data)
+        self.pages_written += 1
+
+    def add_page_file(self, page_number, path, extension='jpg'):
+        """Append one page from a file on disk, copied in chunks"""
+        member = self._member(page_entry_name(page_number, extension))
+        with open(path, 'rb') as src, self.zip.open(member, 'w') as dest:
+            shutil.copyfileobj(src, dest, COPY_CHUNK_SIZE)
+        self.pages_written += 1
+
+    def close(self):
+        """Write the central directory"""
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        return False
+
+
+class ChunkBuffer:
+    """Write-only stream collecting bytes until they are drained"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_archive(page_files):
+    """Yield archive bytes for (page number, image path) pairs as they come in
+
+    Each page is sent as soon as the iterator produces it, so a response built
+    on this starts streaming before the remaining pages exist.
+    """
+    buffer = ChunkBuffer()
+    writer = StreamingArchiveWriter(buffer)
+    for page_number, path in page_files:
+        writer.add_page_file(page_number, path)
+        yield buffer.drain()
+    writer.close()
+    yield buffer.drain()
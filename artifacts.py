@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Deterministic artifact store
+Finished outputs are indexed by what produced them (book, width, page range,
+output profile), with a JSON metadata sidecar per artifact, so an identical
+request can be answered from disk instead of fetching the book again
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+
+def artifact_key(order_id, book_hash, width, start_page, end_page, profile):
+    """Key identifying one output of one photo book"""
+    return {
+        'order_id': str(order_id),
+        'hash': str(book_hash),
+        'width': int(width),
+        'start_page': int(start_page),
+        'end_page': int(end_page),
+        'profile': profile,
+    }
+
+
+def key_digest(key):
+    """Stable digest of a key (unlike hash(), the same in every process)"""
+    canonical = json.dumps(key, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ArtifactStore:
+    def __init__(self, root="output"):
+        self.root = root
+        self.index_dir = os.path.join(root, ".artifacts")
+
+    def default_filename(self, key, extension):
+        """Deterministic file name for an artifact"""
+        order = ''.join(c for c in key['order_id'] if c.isalnum()) or 'book'
+        return f"cewe_photobook_{order}_{key_digest(key)[:10]}.{extension}"
+
+    def _sidecar_path(self, key):
+        return os.path.join(self.index_dir, f"{key_digest(key)}.json")
+
+    def lookup(self, key):
+        """Metadata of a stored artifact for key, or None if missing or stale"""
+        try:
+            with open(self._sidecar_path(key)) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # The file may have been deleted or replaced since it was recorded
+        try:
+            if os.path.getsize(metadata['path']) != metadata['bytes']:
+                return None
+        except (OSError, KeyError):
+            return None
+        return metadata
+
+    def commit(self, key, path, **details):
+        """Record a finished artifact and return its metadata"""
+        metadata = dict(details, key=key, path=path, bytes=os.path.getsize(path), created_at=time.time())
+        os.makedirs(self.index_dir, exist_ok=True)
+        sidecar = self._sidecar_path(key)
+        temp = f"{sidecar}.{os.getpid()}.tmp"
+        with open(temp, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(temp, sidecar)
+        return metadata
+
+    def deliver(self, path, filename):
+        """Make an existing artifact available under another file name in the store"""
+        target = os.path.join(self.root, filename)
+        if os.path.abspath(target) == os.path.abspath(path):
+            return path
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+        return target
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+ASGI serving mode
+Serves the web interface from an asyncio event loop instead of a
+monkey-patched gevent worker. Socket.IO runs natively on the loop, so an
+idle WebSocket client costs a coroutine rather than a greenlet, and nothing
+depends on monkey-patching. HTTP routes run in a thread pool and jobs in
+real threads (and worker processes for CPU-heavy variants), so a blocking
+library call only ties up its own thread, never the loop.
+
+    uvicorn asgi_app:application --host 0.0.0.0 --port 4200
+"""
+
+import asyncio
+import logging
+import os
+
+# Must be set before web_interface is imported: it decides on monkey-patching
+os.environ['CEWE_SERVER_MODE'] = 'asgi'
+
+import socketio
+from a2wsgi import WSGIMiddleware
+
+import web_interface
+from loop_monitor import loop_monitor
+
+
+# Threads serving Flask routes; long downloads and exports each hold one
+WSGI_THREADS = int(os.environ.get('CEWE_ASGI_WSGI_THREADS', '32'))
+# Seconds after startup before heavy job modules are imported
+PREWARM_DELAY = float(os.environ.get('PREWARM_DELAY', '1.0'))
+
+logger = logging.getLogger(__name__)
+
+
+class SocketIOBridge:
+    """Stands in for Flask-SocketIO's server so socketio.emit() from any
+    thread is delivered by the AsyncServer on the event loop"""
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = None
+
+    def emit(self, event, data=None, namespace=None, to=None, room=None, skip_sid=None, callback=None, **kwargs):
+        if self.loop is None:
+            # Not serving yet, so no client can be listening
+            return
+        coroutine = self.server.emit(event, data, to=to or room, skip_sid=skip_sid, namespace=namespace or '/')
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.loop.create_task(coroutine)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="*",
+                           logger=False, engineio_logger=False,
+                           ping_timeout=60, ping_interval=25)
+bridge = SocketIOBridge(sio)
+web_interface.socketio.server = bridge
+
+
+@sio.event
+async def connect(sid, environ):
+    """Handle client connection"""
+    await sio.emit('connected', {'message': 'Connected to server'}, to=sid)
+
+
+@sio.event
+async def disconnect(sid, *args):
+    """Handle client disconnection"""
+    print('Client disconnected')
+
+
+async def on_startup():
+    """Hook the bridge and loop monitor up to the running loop, then prewarm"""
+    loop = asyncio.get_running_loop()
+    bridge.loop = loop
+    loop_monitor.start_asyncio()
+    if PREWARM_DELAY >= 0:
+        loop.call_later(PREWARM_DELAY,
+                        lambda: loop.run_in_executor(None, web_interface.prewarm_imports))
+
+
+application = socketio.ASGIApp(sio, WSGIMiddleware(web_interface.application, workers=WSGI_THREADS),
+                               on_startup=on_startup)
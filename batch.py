@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Batch CEWE Photo Book Fetcher
+Converts many photo book URLs in one run. Page downloads from all books share
+one thread pool and the process-wide connection pool, while PDF assembly of
+finished books runs in parallel worker processes. Books go through the same
+artifact store as single fetches, so a PDF an identical run already built is
+reused and identical books in one batch are only fetched once.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from cewe_fetcher import CEWEPhotoBookFetcher, parse_width
+
+
+BOOK_OPTIONS = {
+    'start_page': int,
+    'end_page': int,
+    'width': parse_width,
+    'output': str,
+}
+
+
+def parse_entry(line, line_number):
+    """Parse one input line: a JSON object or 'URL [key=value ...]'"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+
+    if line.startswith('{'):
+        entry = json.loads(line)
+    else:
+        url, *options = line.split()
+        entry = {'url': url}
+        for option in options:
+            key, _, value = option.partition('=')
+            entry[key.replace('-', '_')] = value
+
+    if 'url' not in entry:
+        raise ValueError(f"Line {line_number}: missing url")
+    for key in list(entry):
+        if key != 'url':
+            if key not in BOOK_OPTIONS:
+                raise ValueError(f"Line {line_number}: unknown option '{key}'")
+            entry[key] = BOOK_OPTIONS[key](entry[key])
+    return entry
+
+
+def read_entries(source):
+    """Read batch entries from a file path or '-' for stdin"""
+    stream = sys.stdin if source == '-' else open(source)
+    try:
+        entries = []
+        for line_number, line in enumerate(stream, 1):
+            entry = parse_entry(line, line_number)
+            if entry:
+                entries.append(entry)
+        return entries
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def assemble_pdf(photobook_url, images_dir, image_paths, output_filename):
+    """Build one book's PDF (runs in a worker process)"""
+    fetcher = CEWEPhotoBookFetcher(photobook_url, verbose=False)
+    fetcher.images_dir = images_dir
+    return fetcher.create_pdf_with_pymupdf(image_paths, output_filename)
+
+
+class BatchBook:
+    def __init__(self, index, entry, default_width):
+        self.index = index
+        self.url = entry['url']
+        self.output = entry.get('output') or f"batch_{index:03d}.pdf"
+        if not self.output.lower().endswith('.pdf'):
+            self.output += '.pdf'
+        self.output = re.sub(r'[<>:"/\\|?*]', '_', self.output)
+
+        self.fetcher = CEWEPhotoBookFetcher(
+            photobook_url=self.url,
+            start_page=entry.get('start_page', 1),
+            end_page=entry.get('end_page'),
+            target_width=entry.get('width', default_width),
+            verbose=False
+        )
+        # Each book gets its own page directory so page_NNN.jpg never collides
+        self.fetcher.images_dir = os.path.join("images", f"batch_{index:03d}")
+
+        self.status = 'pending'
+        self.error = None
+        self.image_paths = {}
+        self.failed_pages = []
+        self.pending_pages = 0
+        self.started = time.perf_counter()
+        self.fetched_at = None
+        self.finished_at = None
+        self.pdf_path = None
+        self.lock = threading.Lock()
+        # Set once the PDF is assembled or the book has failed
+        self.finished = threading.Event()
+
+    def report(self):
+        """Summary row for this book"""
+        return {
+            'url': self.url,
+            'status': self.status,
+            'error': self.error,
+            'pages': len(self.image_paths),
+            'failed_pages': sorted(self.failed_pages),
+            'output': self.pdf_path,
+            'bytes': os.path.getsize(self.pdf_path) if self.pdf_path and os.path.exists(self.pdf_path) else 0,
+            'fetch_seconds': round(self.fetched_at - self.started, 2) if self.fetched_at else None,
+            'total_seconds': round(self.finished_at - self.started, 2) if self.finished_at else None,
+        }
+
+
+class BatchRunner:
+    def __init__(self, entries, download_workers=8, cpu_workers=None, default_width=1080):
+        self.books = [BatchBook(i + 1, entry, default_width) for i, entry in enumerate(entries)]
+        self.download_pool = ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="download")
+        # Each book waits for its PDF in a thread of its own
+        self.book_pool = ThreadPoolExecutor(max_workers=max(1, len(self.books)), thread_name_prefix="book")
+        # Forking once download threads exist could copy a lock some thread
+        # holds into the worker, where nothing ever releases it
+        self.cpu_pool = ProcessPoolExecutor(max_workers=cpu_workers or os.cpu_count(),
+                                            mp_context=multiprocessing.get_context('spawn'))
+
+    def _analyze(self, book):
+        """Extract the image URL pattern and page count for one book"""
+        book.status = 'analyzing'
+        if not book.fetcher.extract_image_url_pattern():
+            book.status = 'failed'
+            book.error = 'Could not extract image URL pattern'
+            book.finished_at = time.perf_counter()
+            return False
+        return True
+
+    def _produce(self, book):
+        """Produce one book's PDF through the artifact store, reusing or joining an identical run"""
+        path = book.fetcher._produce('pdf', book.output, lambda filename: self._build(book, filename))
+        if book.fetched_at is None and path:
+            # Built by an earlier or concurrent identical run
+            book.pdf_path = path
+            book.status = 'done'
+            book.finished_at = time.perf_counter()
+            print(f"♻️  Book {book.index}: {path}")
+        return path
+
+    def _build(self, book, filename):
+        """Queue the book's pages for download and wait for its PDF"""
+        book.output = filename
+        pages = list(range(book.fetcher.start_page, book.fetcher.end_page + 1))
+        book.pending_pages = len(pages)
+        book.status = 'fetching'
+        print(f"📄 Book {book.index}: queued {len(pages)} pages")
+        if not pages:
+            self._submit_assembly(book)
+        for page_num in pages:
+            self.download_pool.submit(self._fetch_page, book, page_num)
+
+        book.finished.wait()
+        # Only a complete PDF is committed to the artifact store
+        book.fetcher.failed_pages = book.failed_pages
+        return book.pdf_path
+
+    def _fetch_page(self, book, page_num):
+        """Download one page; assemble the book once its last page is in"""
+        try:
+            image_path = book.fetcher.fetch_image(page_num)
+        except Exception as e:
+            image_path = None
+            print(f"❌ Book {book.index} page {page_num}: {e}")
+
+        with book.lock:
+            if image_path:
+                book.image_paths[page_num] = image_path
+            else:
+                book.failed_pages.append(page_num)
+            book.pending_pages -= 1
+            last_page = book.pending_pages == 0
+
+        if last_page:
+            self._submit_assembly(book)
+
+    def _submit_assembly(self, book):
+        """Hand a fully downloaded book to the CPU pool"""
+        book.fetched_at = time.perf_counter()
+        if not book.image_paths:
+            book.status = 'failed'
+            book.error = 'No pages could be fetched'
+            book.finished_at = time.perf_counter()
+            book.finished.set()
+            return
+
+        book.status = 'assembling'
+        print(f"📚 Book {book.index}: {len(book.image_paths)} pages fetched, assembling PDF")
+        image_paths = [book.image_paths[page] for page in sorted(book.image_paths)]
+        try:
+            future = self.cpu_pool.submit(assemble_pdf, book.url, book.fetcher.images_dir,
+                                          image_paths, book.output)
+        except Exception as e:
+            book.status = 'failed'
+            book.error = str(e)
+            book.finished_at = time.perf_counter()
+            book.finished.set()
+            return
+        future.add_done_callback(lambda f: self._assembled(book, f))
+
+    def _assembled(self, book, future):
+        book.finished_at = time.perf_counter()
+        try:
+            book.pdf_path = future.result()
+        except Exception as e:
+            book.error = str(e)
+        book.status = 'done' if book.pdf_path else 'failed'
+        icon = '✅' if book.pdf_path else '❌'
+        print(f"{icon} Book {book.index}: {book.pdf_path or book.error or 'PDF creation failed'}")
+        book.finished.set()
+
+    def run(self):
+        """Run the whole batch and return the summary report"""
+        started = time.perf_counter()
+        print(f"🚀 Starting batch of {len(self.books)} photo books")
+
+        try:
+            # Analyse all books concurrently; the network is idle otherwise
+            analyzed = list(self.download_pool.map(self._analyze, self.books))
+
+            # Start books in order so early books queue their pages first and
+            # their PDF assembly overlaps with downloading the later ones
+            productions = []
+            for book, ok in zip(self.books, analyzed):
+                if not ok:
+                    print(f"❌ Book {book.index}: {book.error}")
+                    continue
+                productions.append((book, self.book_pool.submit(self._produce, book)))
+
+            for book, production in productions:
+                error = production.exception()
+                if error:
+                    book.status = 'failed'
+                    book.error = str(error)
+        finally:
+            self.book_pool.shutdown(wait=True)
+            self.download_pool.shutdown(wait=True)
+            self.cpu_pool.shutdown(wait=True)
+
+        books = [book.report() for book in self.books]
+        return {
+            'books': books,
+            'succeeded': sum(1 for book in books if book['status'] == 'done'),
+            'failed': sum(1 for book in books if book['status'] != 'done'),
+            'pages': sum(book['pages'] for book in books),
+            'bytes': sum(book['bytes'] for book in books),
+            'seconds': round(time.perf_counter() - started, 2),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert many CEWE photo book URLs in one run")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="File with one URL per line (or JSON object per line); '-' for stdin")
+    parser.add_argument("-w", "--width", type=parse_width, default=1080,
+                        help="Default image width in pixels, or 'native' (default: 1080)")
+    parser.add_argument("-j", "--download-workers", type=int, default=8,
+                        help="Concurrent page downloads across all books (default: 8)")
+    parser.add_argument("-c", "--cpu-workers", type=int, default=None,
+                        help="Parallel PDF assembly processes (default: CPU count)")
+    parser.add_argument("-r", "--report", help="Write the summary report as JSON to this file")
+
+    args = parser.parse_args()
+
+    try:
+        entries = read_entries(args.input)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error reading batch input: {e}")
+        sys.exit(1)
+
+    if not entries:
+        print("❌ No photo book URLs given")
+        sys.exit(1)
+
+    runner = BatchRunner(entries, download_workers=args.download_workers,
+                         cpu_workers=args.cpu_workers, default_width=args.width)
+    summary = runner.run()
+
+    print(f"\n📊 Batch summary: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+          f"{summary['pages']} pages, {summary['bytes'] / (1024 * 1024):.2f} MB in {summary['seconds']}s")
+    for book in summary['books']:
+        icon = '✅' if book['status'] == 'done' else '❌'
+        print(f"   {icon} {book['url']} -> {book['output'] or book['error']}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Report written to {args.report}")
+
+    if summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the CEWE fetcher and spread creator
+Starts a local stand-in for the CEWE share page and photoBookPageRender.do
+endpoint, times the pipeline end to end and per stage, and writes the
+results as JSON so runs can be compared
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image, ImageDraw
+
+# Make the project modules importable regardless of the working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SHARE_PATH = "/web/42000005/share.html"
+RENDER_PATH = "/web/42000005/photoBookPageRender.do"
+PAGE_ASPECT = 0.7  # Height relative to width, roughly a square-ish photo book page
+
+
+class FakeCEWEServer:
+    """Local HTTP server that imitates the parts of CEWE the fetcher talks to"""
+
+    def __init__(self, pages=24, latency=0.02, jitter=0.01, error_rate=0.0, seed=0, native_width=None):
+        self.pages = pages
+        # Pages wider than this are upscaled, like a book with limited source resolution
+        self.native_width = native_width
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.image_cache = {}
+        self.cache_lock = threading.Lock()
+        self.request_count = 0
+        self.httpd = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def share_url(self):
+        return f"{self.base_url}{SHARE_PATH}"
+
+    def render_page(self, page, width):
+        """Return a synthetic JPEG for a page, generated once per (page, width)"""
+        key = (page, width)
+        with self.cache_lock:
+            if key in self.image_cache:
+                return self.image_cache[key]
+
+        height = max(1, int(width * PAGE_ASPECT))
+        render_width = min(width, self.native_width) if self.native_width else width
+        render_height = max(1, int(render_width * PAGE_ASPECT))
+        img = Image.effect_noise((render_width, render_height), 40).convert('RGB')
+        draw = ImageDraw.Draw(img)
+        shade = (page * 37) % 255
+        draw.rectangle([render_width // 8, render_height // 8, render_width * 7 // 8, render_height * 7 // 8],
+                       outline=(shade, 255 - shade, 128), width=max(1, render_width // 100))
+        draw.text((render_width // 10, render_height // 10), f"Page {page}", fill=(255, 255, 255))
+        if render_width != width:
+            img = img.resize((width, height), Image.Resampling.BICUBIC)
+
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=90)
+        data = buffer.getvalue()
+
+        with self.cache_lock:
+            self.image_cache[key] = data
+        return data
+
+    def share_page(self):
+        """HTML share page containing the image_src link the fetcher looks for"""
+        image_url = (f"{self.base_url}{RENDER_PATH}?orderId=1&position=0&page=0"
+                     f"&width=540&hash=benchmark&access=LOCAL&skipSessionTimeout=true")
+        return (
+            "<html><head><title>Benchmark photo book</title></head><body>"
+            '<div id="ips_content_wrapper" class="myAccount">'
+            f'<link rel="image_src" href="{image_url}">'
+            "</div></body></html>"
+        ).encode('utf-8')
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _delay(self):
+                server.request_count += 1
+                delay = server.latency + server.random.uniform(-server.jitter, server.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+
+            def _respond(self, include_body):
+                parsed = urlparse(self.path)
+                params = parse_qs(parsed.query)
+
+                if parsed.path == SHARE_PATH:
+                    body, content_type, status = server.share_page(), 'text/html', 200
+                elif parsed.path == RENDER_PATH:
+                    self._delay()
+                    page = int(params.get('page', ['0'])[0])
+                    width = int(params.get('width', ['1080'])[0])
+                    if server.random.random() < server.error_rate:
+                        body, content_type, status = b"busy", 'text/plain', 503
+                    elif page < 0 or page > server.pages:
+                        body, content_type, status = b"not found", 'text/plain', 404
+                    else:
+                        body, content_type, status = server.render_page(page, width), 'image/jpeg', 200
+                else:
+                    body, content_type, status = b"not found", 'text/plain', 404
+
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                if status == 503:
+                    self.send_header('Retry-After', '0')
+                self.end_headers()
+                if include_body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(include_body=True)
+
+            def do_HEAD(self):
+                self._respond(include_body=False)
+
+        return Handler
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+
+def time_method(obj, name, timings, prefix=""):
+    """Wrap an instance method so every call adds its duration to timings"""
+    method = getattr(obj, name)
+    label = prefix + name
+
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timings[label] = timings.get(label, 0.0) + time.perf_counter() - started
+
+    setattr(obj, name, timed)
+
+
+def run_once(server, args):
+    """Run the full fetch + spread pipeline once and return stage timings"""
+    from cewe_fetcher import CEWEPhotoBookFetcher
+    from create_spreads import PDFSpreadCreator
+
+    timings = {}
+
+    fetcher = CEWEPhotoBookFetcher(photobook_url=server.share_url, target_width=args.width)
+    for name in ('extract_image_url_pattern', 'detect_total_pages',
+                 'fetch_all_images', 'create_pdf_with_pymupdf'):
+        time_method(fetcher, name, timings)
+
+    started = time.perf_counter()
+    success = fetcher.run("benchmark.pdf")
+    timings['fetcher_run'] = time.perf_counter() - started
+    if not success:
+        raise RuntimeError("Fetcher run failed against the local server")
+
+    pdf_path = os.path.join(fetcher.output_dir, "benchmark.pdf")
+    creator = PDFSpreadCreator(input_pdf=pdf_path, dpi=args.dpi, raster_cache=False)
+    for name in ('extract_pages_as_images', 'create_spreads', 'create_pdf_with_pymupdf'):
+        time_method(creator, name, timings, prefix="spreads.")
+
+    started = time.perf_counter()
+    if not creator.run():
+        raise RuntimeError("Spread creator run failed")
+    timings['spreads_run'] = time.perf_counter() - started
+
+    timings['pages'] = fetcher.end_page - fetcher.start_page + 1
+    timings['width'] = fetcher.target_width
+    timings['pdf_bytes'] = os.path.getsize(pdf_path)
+    return timings
+
+
+def summarize(runs):
+    """Aggregate per-stage timings over all runs"""
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs]
+        summary[key] = {
+            'min': min(values),
+            'median': statistics.median(values),
+            'mean': statistics.mean(values),
+            'max': max(values),
+        }
+    return summary
+
+
+def compare(current, baseline_path):
+    """Print median deltas against a previous results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['summary']
+
+    print(f"\n📊 Comparison with {baseline_path} (median):")
+    for stage, stats in current.items():
+        if stage not in baseline:
+            continue
+        before, after = baseline[stage]['median'], stats['median']
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"   {stage:45s} {before:10.3f} -> {after:10.3f}  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against a local fake CEWE server")
+    parser.add_argument("-p", "--pages", type=int, default=24,
+                        help="Number of pages the fake book has (default: 24)")
+    parser.add_argument("-w", "--width", type=lambda value: value if value == 'native' else int(value),
+                        default=1080, help="Image width in pixels, or 'native' to probe it (default: 1080)")
+    parser.add_argument("-d", "--dpi", type=int, default=150,
+                        help="DPI for spread extraction (default: 150)")
+    parser.add_argument("-r", "--runs", type=int, default=3,
+                        help="Number of repetitions (default: 3)")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Server latency per page request in seconds (default: 0.02)")
+    parser.add_argument("--jitter", type=float, default=0.01,
+                        help="Random latency jitter in seconds (default: 0.01)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of page requests answered with 503 (default: 0)")
+    parser.add_argument("--native-width", type=int,
+                        help="Width above which the fake server only upscales pages (default: no limit)")
+    parser.add_argument("-o", "--output", default="bench_results.json",
+                        help="Results file (default: bench_results.json)")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    server = FakeCEWEServer(pages=args.pages, latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate, native_width=args.native_width).start()
+    print(f"🧪 Fake CEWE server running at {server.base_url}")
+
+    runs = []
+    original_cwd = os.getcwd()
+    try:
+        for i in range(args.runs):
+            # Each run gets a clean scratch directory for images/, output/ etc.
+            with tempfile.TemporaryDirectory(prefix="cewe_bench_") as work_dir:
+                os.chdir(work_dir)
+                try:
+                    print(f"\n⏱️  Run {i + 1}/{args.runs}")
+                    runs.append(run_once(server, args))
+                finally:
+                    os.chdir(original_cwd)
+    finally:
+        server.stop()
+
+    summary = summarize(runs)
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'config': vars(args),
+        'python': sys.version.split()[0],
+        'server_requests': server.request_count,
+        'runs': runs,
+        'summary': summary,
+    }
+
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print("\n📊 Median timings (seconds):")
+    for stage, stats in summary.items():
+        print(f"   {stage:45s} {stats['median']:10.3f}")
+    print(f"\n💾 Results written to {output_path}")
+
+    if compare_path:
+        compare(summary, compare_path)
+
+
+if __name__ == "__main__":
+    main()
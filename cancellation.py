@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Cooperative cancellation for long-running jobs
+Shared by the CEWE fetcher, the spread creator and the web interface
+"""
+
+import threading
+from concurrent.futures import wait
+
+
+CANCEL_POLL_SECONDS = 0.5  # how often wait_for() checks for cancellation
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once its cancellation token has been triggered"""
+
+
+class CancellationToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        """Whether cancellation has been requested"""
+        return self._event.is_set()
+
+    def cancel(self):
+        """Request cancellation and abort any registered in-flight work"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+            self._callbacks.clear()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def raise_if_cancelled(self):
+        """Raise JobCancelled if cancellation has been requested"""
+        if self._event.is_set():
+            raise JobCancelled()
+
+    def wait(self, timeout):
+        """Sleep for up to timeout seconds, waking early on cancellation"""
+        return self._event.wait(timeout)
+
+    def register(self, callback):
+        """Register a callback that aborts in-flight work (e.g. closing a response)
+
+        Returns a function that unregisters the callback again. If the token is
+        already cancelled the callback runs immediately.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+
+                def unregister():
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+
+                return unregister
+
+        callback()
+        return lambda: None
+
+
+def wait_for(futures, cancel_token, poll_seconds=CANCEL_POLL_SECONDS):
+    """Wait until all futures are done, checking cancel_token every poll_seconds
+
+    On cancellation the futures that have not started yet are cancelled and
+    JobCancelled is raised; ones already running are left to finish.
+    """
+    pending = set(futures)
+    while pending:
+        if cancel_token.cancelled:
+            for future in pending:
+                future.cancel()
+            raise JobCancelled()
+        _, pending = wait(pending, timeout=poll_seconds)
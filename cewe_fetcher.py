@@ -5,81 +5,256 @@ Scrapes CEWE photo book URLs to extract image patterns and fetches all pages
 """
 
 import requests
+import codecs
+import io
+import multiprocessing
 import os
+import shutil
 import time
-from PIL import Image
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from html.parser import HTMLParser
+from PIL import Image, ImageChops, ImageStat
 from tqdm import tqdm
 import sys
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
-from bs4 import BeautifulSoup
 import re
 
+import metrics
+from cancellation import CancellationToken, JobCancelled, wait_for
+from cost_estimator import COST_SAMPLE_PAGES, JobHistory, estimate_fetch
+from archive_stream import StreamingArchiveWriter
+from artifacts import ArtifactStore, artifact_key, key_digest
+from http_client import create_session
+from memory_governor import pixel_bytes, reserve_pixels
+from page_cache import FINGERPRINT_THRESHOLD, FINGERPRINT_WIDTH, PageCache, fingerprint, fingerprint_distance
+from pdf_stream import StreamingPDFWriter
+from rate_governor import RETRY_STATUSES, backoff_delay, get_governor, parse_retry_after
+from singleflight import SingleFlight
+from tracing import NULL_TRACER
+from variants import (SPREAD_START_PAGE, build_variant, parse_variant, peak_pixel_bytes, variant_profile,
+                      variant_suffix)
+
+
+THUMBNAIL_SIZE = (160, 160)
+MAX_RETRIES = 3
+SHARE_PAGE_CHUNK_SIZE = 16 * 1024
+REFRESH_WORKERS = 8  # parallel tiny-render downloads in refresh mode
+
+# Native-resolution discovery: target_width=NATIVE_WIDTH probes these widths
+# on a few sample pages and keeps the widest one that still adds detail.
+# They start well below the width share links ask for (540), so the first
+# step is one every book renders natively.
+NATIVE_WIDTH = 'native'
+DEFAULT_WIDTH = 1080
+NATIVE_PROBE_WIDTHS = (270, 360, 540, 720, 1080, 1440, 2160, 2880)
+NATIVE_SAMPLE_PAGES = 3
+# A step up in width adds real detail only while the detail it gains stays
+# above this fraction of what the first step gained; photos carry about as
+# much detail per step, upscaled renders much less
+NATIVE_MIN_DETAIL = 0.6
+
+# Identical work running at the same time in different jobs is done once
+JOB_FLIGHTS = SingleFlight()   # keyed by artifact key digest
+PAGE_FLIGHTS = SingleFlight()  # keyed by page URL
+
+
+def make_thumbnail(image_path, thumbnail_path, size=THUMBNAIL_SIZE):
+    """Write a small JPEG preview of a page
+
+    Uses JPEG draft mode so the decoder scales down by 1/2..1/8 while
+    decoding, instead of decoding the full page and resizing afterwards.
+    """
+    with Image.open(image_path) as img:
+        img.draft('RGB', size)
+        img = img.convert('RGB')
+        img.thumbnail(size, Image.Resampling.BILINEAR)
+        img.save(thumbnail_path, 'JPEG', quality=80)
+    return thumbnail_path
+
+
+def detail_residual(image, width):
+    """Detail an image holds beyond what a render at width can show
+
+    Mean grey-level difference between the image and a copy scaled down to
+    width and back up. An upscaled render has little left over.
+    """
+    grey = image.convert('L')
+    height = max(1, round(grey.height * width / grey.width))
+    round_trip = grey.resize((width, height), Image.Resampling.BOX).resize(grey.size, Image.Resampling.BICUBIC)
+    return ImageStat.Stat(ImageChops.difference(grey, round_trip)).mean[0]
+
+
+class ImageSrcScanner(HTMLParser):
+    """Incremental scan for <link rel="image_src"> inside div#ips_content_wrapper.myAccount
+
+    Fed the share page chunk by chunk; href is set as soon as the link has
+    been parsed, so the caller can stop reading the rest of the page.
+    """
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.wrapper_depth = 0  # nesting depth of divs inside the content wrapper
+        self.href = None
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'div':
+            if self.wrapper_depth:
+                self.wrapper_depth += 1
+            elif attrs.get('id') == 'ips_content_wrapper' and 'myAccount' in (attrs.get('class') or '').split():
+                self.wrapper_depth = 1
+        elif tag == 'link' and self.wrapper_depth and self.href is None:
+            if 'image_src' in (attrs.get('rel') or '').split() and attrs.get('href'):
+                self.href = attrs['href']
+    
+    def handle_endtag(self, tag):
+        if tag == 'div' and self.wrapper_depth:
+            self.wrapper_depth -= 1
+
 
 class CEWEPhotoBookFetcher:
-    def __init__(self, photobook_url, start_page=1, end_page=None, target_width=1080):
+    def __init__(self, photobook_url, start_page=1, end_page=None, target_width=1080, cancel_token=None,
+                 on_page_fetched=None, tracer=None, verbose=True):
         self.photobook_url = photobook_url
         self.start_page = start_page
         self.end_page = end_page
         self.target_width = target_width
+        self.source_image_url = None
         self.base_image_url = None
         self.total_pages = None
+        self.output_path = None
+        self.cancel_token = cancel_token or CancellationToken()
+        # Optional callback(page_number, image_path) invoked as each page lands
+        self.on_page_fetched = on_page_fetched
+        self.tracer = tracer or NULL_TRACER
+        self.verbose = verbose
+        self.failed_pages = []
+        # Content-Length of pages seen by HEAD requests at the target width
+        self.page_bytes = {}
+        # Set once native-width discovery has found the book's resolution
+        self.native_width = None
+        # Reuse a complete artifact of an identical earlier run instead of fetching again
+        self.reuse_artifacts = True
         
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        # Per-job session (own cookies) on top of the process-wide connection pool
+        self.session = create_session()
         
-        # Create directories
+        # Working directories, only created once something is written to disk
         self.images_dir = "images"
         self.output_dir = "output"
+        # Optional scratch.JobScratch; page files then live there instead of images_dir
+        self.scratch = None
+    
+    def log(self, message=""):
+        """Report progress on stdout unless the fetcher is quiet"""
+        if self.verbose:
+            print(message)
+    
+    def _ensure_dirs(self):
+        """Create the image and output directories used by the on-disk pipeline"""
         os.makedirs(self.images_dir, exist_ok=True)
         os.makedirs(self.output_dir, exist_ok=True)
     
+    def _scratch_path(self, filename):
+        """Path for a new intermediate file (job scratch space or images_dir)"""
+        if self.scratch:
+            return self.scratch.path(filename)
+        self._ensure_dirs()
+        return os.path.join(self.images_dir, filename)
+    
     def extract_image_url_pattern(self):
         """Extract the image URL pattern from the CEWE photo book page"""
-        print(f"🔍 Analyzing photo book URL: {self.photobook_url}")
+        self.log(f"🔍 Analyzing photo book URL: {self.photobook_url}")
         
         try:
-            response = self.session.get(self.photobook_url, timeout=30)
-            response.raise_for_status()
-            
-            # Parse the HTML
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find the div with id="ips_content_wrapper" and class="myAccount"
-            content_wrapper = soup.find('div', {'id': 'ips_content_wrapper', 'class': 'myAccount'})
+            with self.tracer.span('extract_html') as span:
+                image_url, html = self._scan_image_src(span)
+                if not image_url:
+                    # The streaming scan can miss on unusual markup; parse the whole page
+                    image_url = self._find_image_src(html)
             
-            if not content_wrapper:
-                print("❌ Could not find the content wrapper div")
+            if not image_url:
                 return False
             
-            # Find the link element with rel="image_src"
-            image_link = content_wrapper.find('link', {'rel': 'image_src'})
-            
-            if not image_link or not image_link.get('href'):
-                print("❌ Could not find the image source link")
-                return False
-            
-            image_url = image_link['href']
-            print(f"✅ Found image URL: {image_url}")
+            self.log(f"✅ Found image URL: {image_url}")
             
             # Replace width parameter and clean up the URL
+            self.source_image_url = image_url
+            discover = self.target_width == NATIVE_WIDTH
+            if discover:
+                # Page detection needs a concrete width; probing follows below
+                self.target_width = self.get_link_width() or DEFAULT_WIDTH
             self.base_image_url = self.prepare_image_url(image_url)
-            print(f"📐 Scaled to width {self.target_width}: {self.base_image_url}")
+            self.log(f"📐 Scaled to width {self.target_width}: {self.base_image_url}")
             
             # Try to detect total pages if not specified
             if self.end_page is None:
                 self.detect_total_pages()
             
+            if discover:
+                self.apply_native_width(self.discover_native_width())
+            
             return True
             
+        except JobCancelled:
+            raise
         except requests.exceptions.RequestException as e:
-            print(f"❌ Error fetching photo book page: {e}")
+            self.log(f"❌ Error fetching photo book page: {e}")
             return False
         except Exception as e:
-            print(f"❌ Error parsing photo book page: {e}")
+            self.log(f"❌ Error parsing photo book page: {e}")
             return False
     
+    def _scan_image_src(self, span):
+        """Stream the share page until the image_src link has been seen
+
+        Returns (href or None, the bytes read). Reading stops right after the
+        link, so time and memory do not depend on the rest of the page.
+        """
+        response = self.request('GET', self.photobook_url, timeout=30, stream=True)
+        try:
+            response.raise_for_status()
+            try:
+                decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            
+            scanner = ImageSrcScanner()
+            chunks = []
+            for chunk in response.iter_content(chunk_size=SHARE_PAGE_CHUNK_SIZE):
+                self.cancel_token.raise_if_cancelled()
+                chunks.append(chunk)
+                scanner.feed(decoder.decode(chunk))
+                if scanner.href:
+                    break
+            
+            html = b"".join(chunks)
+            span.set(bytes=len(html), early_exit=scanner.href is not None)
+            return scanner.href, html
+        finally:
+            response.close()
+    
+    def _find_image_src(self, html):
+        """Find the image_src link with a full BeautifulSoup parse of the page"""
+        from bs4 import BeautifulSoup
+        
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Find the div with id="ips_content_wrapper" and class="myAccount"
+        content_wrapper = soup.find('div', {'id': 'ips_content_wrapper', 'class': 'myAccount'})
+        if not content_wrapper:
+            self.log("❌ Could not find the content wrapper div")
+            return None
+        
+        # Find the link element with rel="image_src"
+        image_link = content_wrapper.find('link', {'rel': 'image_src'})
+        if not image_link or not image_link.get('href'):
+            self.log("❌ Could not find the image source link")
+            return None
+        
+        return image_link['href']
+    
     def prepare_image_url(self, url):
         """Prepare the image URL by scaling width and cleaning parameters"""
         # Parse the URL
@@ -101,35 +276,79 @@ class CEWEPhotoBookFetcher:
     
     def detect_total_pages(self):
         """Try to detect the total number of pages by testing incrementally"""
-        print("🔍 Detecting total pages...")
+        self.log("🔍 Detecting total pages...")
         
         # Start with a reasonable guess and work backwards
         test_pages = [100, 50, 25, 10, 5]
         
-        for test_page in test_pages:
-            if self.test_page_exists(test_page):
-                # Found a page that exists, now find the exact end
-                self.total_pages = self.binary_search_last_page(test_page, test_page + 50)
-                break
+        with self.tracer.span('detect_total_pages'):
+            for test_page in test_pages:
+                if self.test_page_exists(test_page):
+                    # Found a page that exists, now find the exact end
+                    self.total_pages = self.binary_search_last_page(test_page, test_page + 50)
+                    break
         
         if self.total_pages is None:
             # If we can't detect, default to a reasonable number
             self.total_pages = 50
-            print(f"⚠️  Could not detect total pages, defaulting to {self.total_pages}")
+            self.log(f"⚠️  Could not detect total pages, defaulting to {self.total_pages}")
         else:
-            print(f"📚 Detected {self.total_pages} total pages")
+            self.log(f"📚 Detected {self.total_pages} total pages")
         
         if self.end_page is None:
             self.end_page = self.total_pages
     
+    def request(self, method, url, **kwargs):
+        """Send a request through the host-wide rate governor
+
+        Throttled (429/503), 5xx and connection failures are retried with
+        exponential backoff and jitter, honouring Retry-After when present.
+        """
+        governor = get_governor(url)
+        
+        for attempt in range(MAX_RETRIES + 1):
+            governor.acquire(self.cancel_token)
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                governor.record_error()
+                metrics.HTTP_RESPONSES.inc(method=method, status=type(e).__name__)
+                if attempt == MAX_RETRIES or self.cancel_token.cancelled:
+                    raise
+                metrics.HTTP_RETRIES.inc(reason='connection')
+                if self.cancel_token.wait(backoff_delay(attempt)):
+                    raise JobCancelled()
+                continue
+            
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            governor.record(time.monotonic() - started, response.status_code, retry_after)
+            metrics.HTTP_RESPONSES.inc(method=method, status=response.status_code)
+            
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            
+            metrics.HTTP_RETRIES.inc(reason=f'status_{response.status_code}')
+            response.close()
+            if self.cancel_token.wait(max(backoff_delay(attempt), retry_after or 0)):
+                raise JobCancelled()
+    
     def test_page_exists(self, page_num):
         """Test if a specific page exists"""
         url = self.build_page_url(page_num)
-        try:
-            response = self.session.head(url, timeout=10)
-            return response.status_code == 200
-        except:
-            return False
+        self.cancel_token.raise_if_cancelled()
+        with self.tracer.span('probe_page', page=page_num) as span:
+            try:
+                response = self.request('HEAD', url, timeout=10)
+                span.set(status=response.status_code)
+                length = response.headers.get('content-length')
+                if response.status_code == 200 and length and length.isdigit():
+                    self.page_bytes[page_num] = int(length)
+                return response.status_code == 200
+            except JobCancelled:
+                raise
+            except:
+                return False
     
     def binary_search_last_page(self, min_page, max_page):
         """Use binary search to find the last existing page"""
@@ -141,8 +360,8 @@ class CEWEPhotoBookFetcher:
                 max_page = mid - 1
         return min_page
     
-    def build_page_url(self, page_number):
-        """Build URL for a specific page number"""
+    def build_page_url(self, page_number, width=None):
+        """Build URL for a specific page number, optionally at another width"""
         if not self.base_image_url:
             return None
             
@@ -151,6 +370,8 @@ class CEWEPhotoBookFetcher:
         
         # Update the page parameter
         query_params['page'] = [str(page_number)]
+        if width:
+            query_params['width'] = [str(width)]
         
         # Rebuild the URL
         new_query = urlencode(query_params, doseq=True)
@@ -158,97 +379,493 @@ class CEWEPhotoBookFetcher:
                              parsed.params, new_query, parsed.fragment))
         return new_url
     
+    def get_link_width(self):
+        """Width the share page itself asks for in its image_src link (a preview size)"""
+        if not self.source_image_url:
+            return None
+        width = parse_qs(urlparse(self.source_image_url).query).get('width', [None])[0]
+        return int(width) if width and width.isdigit() else None
+    
+    def apply_native_width(self, width):
+        """Use a discovered native width (None keeps the current width)"""
+        if not width:
+            self.log(f"📐 Keeping width {self.target_width}px")
+            return
+        self.target_width = width
+        self.native_width = width
+        self.base_image_url = self.prepare_image_url(self.source_image_url)
+        # Sizes seen so far were for the old width
+        self.page_bytes.clear()
+        self.log(f"📐 Using native width {self.target_width}px")
+    
+    def _probe_page(self, page_number, width, previous_width):
+        """(pixel width, bytes, detail) of one page rendered at width, or None
+        
+        detail is the detail_residual() against previous_width.
+        """
+        buffer = io.BytesIO()
+        with self.tracer.span('probe_width', page=page_number, width=width):
+            try:
+                if not self._download(page_number, self.build_page_url(page_number, width), buffer):
+                    return None
+                size = buffer.tell()
+                with Image.open(buffer) as img:
+                    # Decoded page, its greyscale copy and the round trip
+                    needed = pixel_bytes(img.width, img.height, img.mode) + 3 * pixel_bytes(img.width, img.height, 'L')
+                    with reserve_pixels(needed, self.cancel_token):
+                        return img.size[0], size, detail_residual(img, previous_width)
+            except JobCancelled:
+                raise
+            except Exception:
+                return None
+    
+    def discover_native_width(self, widths=NATIVE_PROBE_WIDTHS, sample_pages=NATIVE_SAMPLE_PAGES):
+        """Find the widest render that still carries real detail
+        
+        Each width in widths is probed on a few pages spread over the book,
+        measuring the detail it holds beyond the previous width (the first
+        width against two thirds of itself). Probing stops at the first width
+        the server caps (returns a narrower image) or whose detail has fallen
+        well below that of the first step, i.e. the server only upscales.
+        Returns the width, or None if nothing could be probed.
+        """
+        if not self.base_image_url:
+            return None
+        
+        last = self.end_page or self.total_pages or self.start_page
+        pages = sorted({self.start_page, (self.start_page + last) // 2, last})[:sample_pages]
+        self.log(f"🔎 Probing native width on pages {', '.join(map(str, pages))}...")
+        
+        native = None
+        reference = None  # detail gained by the first step
+        with self.tracer.span('discover_native_width', pages=len(pages)) as span:
+            for width in sorted(widths):
+                probes = [self._probe_page(page, width, native or width * 2 // 3) for page in pages]
+                probes = [probe for probe in probes if probe]
+                if not probes:
+                    break
+                returned_width = max(probe[0] for probe in probes)
+                page_kb = sum(probe[1] for probe in probes) / len(probes) / 1024
+                
+                if returned_width < width:
+                    # The server caps the width: what it returns is the native size
+                    self.log(f"   {width}px → capped at {returned_width}px")
+                    native = returned_width
+                    break
+                
+                detail = sum(probe[2] for probe in probes) / len(probes)
+                self.log(f"   {width}px: {page_kb:.0f} KB per page, detail {detail:.2f}")
+                if reference is None:
+                    reference = detail
+                elif detail < NATIVE_MIN_DETAIL * reference:
+                    break
+                native = width
+            span.set(width=native)
+        
+        if native:
+            self.log(f"✅ Native width: {native}px")
+        else:
+            self.log("⚠️  Could not probe page widths")
+        return native
+    
+    def estimate_page_bytes(self, page_num=None):
+        """Estimate the size of one page from a HEAD request's Content-Length"""
+        page_num = page_num or self.start_page
+        if page_num not in self.page_bytes:
+            self.test_page_exists(page_num)
+        return self.page_bytes.get(page_num)
+    
+    def sample_page_bytes(self, samples=COST_SAMPLE_PAGES):
+        """Content-Length of a few pages spread over the range, HEAD requests in parallel
+
+        Pages already seen by page-count detection are not requested again.
+        Returns {page: bytes} of the sampled pages that reported a size.
+        """
+        if not self.base_image_url or self.end_page is None:
+            return {}
+        count = self.end_page - self.start_page + 1
+        pages = sorted({self.start_page + round(i * (count - 1) / max(1, samples - 1)) for i in range(samples)})
+        missing = [page for page in pages if page not in self.page_bytes]
+        if missing:
+            with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                list(pool.map(self.test_page_exists, missing))
+        return {page: self.page_bytes[page] for page in pages if page in self.page_bytes}
+    
+    def estimate_cost(self, history=None):
+        """Pre-flight estimate of pages, download and output bytes and processing seconds"""
+        if self.end_page is None:
+            return None
+        return estimate_fetch(self.end_page - self.start_page + 1, self.sample_page_bytes(), history)
+    
+    def analyze(self):
+        """Run URL extraction and page-count detection without fetching pages
+
+        Returns a plain dict that can be cached and later handed to
+        load_analysis() so a real run can start downloading straight away.
+        """
+        if not self.extract_image_url_pattern():
+            return None
+        
+        page_count = self.end_page - self.start_page + 1
+        estimate = self.estimate_cost()
+        page_bytes = estimate['page_bytes']
+        return {
+            'image_url': self.source_image_url,
+            'total_pages': self.total_pages,
+            'end_page': self.end_page,
+            'page_count': page_count,
+            # Only the share page's preview size, not the book's native resolution
+            'link_width': self.get_link_width(),
+            # Known when analysed with target_width='native'
+            'native_width': self.native_width,
+            'width': self.target_width,
+            'estimated_page_bytes': page_bytes,
+            'estimated_size': page_bytes * page_count if page_bytes else None,
+            'estimate': estimate,
+        }
+    
+    def load_analysis(self, analysis):
+        """Reuse the result of a previous analyze() call"""
+        self.source_image_url = analysis['image_url']
+        self.base_image_url = self.prepare_image_url(analysis['image_url'])
+        self.total_pages = analysis.get('total_pages')
+        if self.end_page is None:
+            self.end_page = self.total_pages or analysis.get('end_page')
+        # A 'native' width the analysis did not probe stays unresolved here:
+        # probing downloads pages, so resolve_native_width() does it when the job runs
+        if self.target_width == NATIVE_WIDTH and analysis.get('native_width'):
+            self.apply_native_width(analysis['native_width'])
+    
+    def resolve_native_width(self):
+        """Probe the native width if a loaded analysis left it as 'native'"""
+        if self.target_width != NATIVE_WIDTH:
+            return
+        self.target_width = self.get_link_width() or DEFAULT_WIDTH
+        self.base_image_url = self.prepare_image_url(self.source_image_url)
+        self.apply_native_width(self.discover_native_width())
+    
+    def _download(self, page_number, url, f):
+        """Stream one page image from url into the file object f
+
+        Returns the content type, or None if the server did not send an image.
+        """
+        # The body is streamed straight into f, so the span includes the write
+        with self.tracer.span('download', page=page_number) as span:
+            response = self.request('GET', url, timeout=30, stream=True)
+            span.set(status=response.status_code)
+            # Closing the response from another thread aborts the transfer
+            unregister = self.cancel_token.register(response.close)
+            try:
+                response.raise_for_status()
+                
+                # Check if response is actually an image
+                content_type = response.headers.get('content-type', '')
+                if not content_type.startswith('image/'):
+                    self.log(f"Warning: Page {page_number} returned non-image content: {content_type}")
+                    return None
+                
+                written = 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    self.cancel_token.raise_if_cancelled()
+                    f.write(chunk)
+                    written += len(chunk)
+                span.set(bytes=written)
+                return content_type
+            finally:
+                unregister()
+                response.close()
+    
     def fetch_image(self, page_number):
         """Fetch image for a specific page"""
         url = self.build_page_url(page_number)
         if not url:
             return None
-            
-        image_path = os.path.join(self.images_dir, f"page_{page_number:03d}.jpg")
+        
+        image_path, shared = PAGE_FLIGHTS.do(('file', url), lambda: self._fetch_image_file(page_number, url),
+                                             self.cancel_token)
+        if not shared or not image_path:
+            return image_path
+        
+        # Another job downloaded the same page at the same moment; take a copy
+        own_path = self._scratch_path(f"page_{page_number:03d}.jpg")
+        if os.path.abspath(own_path) == os.path.abspath(image_path):
+            return image_path
+        try:
+            shutil.copyfile(image_path, own_path)
+        except OSError:
+            # The other job already cleaned up its copy
+            return self._fetch_image_file(page_number, url)
+        return self.scratch.record(own_path) if self.scratch else own_path
+    
+    def _fetch_image_file(self, page_number, url):
+        """Download and validate one page into this job's page files"""
+        image_path = self._scratch_path(f"page_{page_number:03d}.jpg")
+        
+        self.cancel_token.raise_if_cancelled()
+        started = time.monotonic()
         
         try:
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            
-            # Check if response is actually an image
-            content_type = response.headers.get('content-type', '')
-            if not content_type.startswith('image/'):
-                print(f"Warning: Page {page_number} returned non-image content: {content_type}")
-                return None
-            
             # Save the image
             with open(image_path, 'wb') as f:
-                f.write(response.content)
+                content_type = self._download(page_number, url, f)
+            if content_type is None:
+                os.remove(image_path)
+                return None
             
             # Verify the image can be opened
-            try:
-                with Image.open(image_path) as img:
-                    # Convert to RGB if needed (for PDF compatibility)
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                        img.save(image_path, 'JPEG', quality=95)
-                        
-                return image_path
-            except Exception as e:
-                print(f"Error processing image for page {page_number}: {e}")
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-                return None
+            with self.tracer.span('validate', page=page_number):
+                try:
+                    with Image.open(image_path) as img:
+                        # Convert to RGB if needed (for PDF compatibility)
+                        if img.mode != 'RGB':
+                            needed = pixel_bytes(img.width, img.height, img.mode) + pixel_bytes(img.width, img.height)
+                            with reserve_pixels(needed, self.cancel_token):
+                                img = img.convert('RGB')
+                                img.save(image_path, 'JPEG', quality=95)
+                    
+                    metrics.PAGE_FETCH_SECONDS.observe(time.monotonic() - started)
+                    metrics.PAGE_FETCH_BYTES.observe(os.path.getsize(image_path))
+                    if self.scratch:
+                        image_path = self.scratch.record(image_path)
+                    return image_path
+                except Exception as e:
+                    self.log(f"Error processing image for page {page_number}: {e}")
+                    if os.path.exists(image_path):
+                        os.remove(image_path)
+                    return None
                 
+        except (JobCancelled, requests.exceptions.RequestException) as e:
+            # Never leave a half-written page behind
+            if os.path.exists(image_path):
+                os.remove(image_path)
+            if self.cancel_token.cancelled:
+                raise JobCancelled()
+            self.log(f"Error fetching page {page_number}: {e}")
+            return None
+    
+    def fetch_image_bytes(self, page_number):
+        """Fetch one page into memory without touching the disk
+
+        Returns (image bytes, metadata dict) or None if the page failed.
+        """
+        url = self.build_page_url(page_number)
+        if not url:
+            return None
+        
+        page, _ = PAGE_FLIGHTS.do(('bytes', url), lambda: self._fetch_image_bytes(page_number, url),
+                                  self.cancel_token)
+        return page
+    
+    def _fetch_image_bytes(self, page_number, url):
+        """Download and validate one page into memory"""
+        self.cancel_token.raise_if_cancelled()
+        started = time.monotonic()
+        buffer = io.BytesIO()
+        
+        try:
+            content_type = self._download(page_number, url, buffer)
         except requests.exceptions.RequestException as e:
-            print(f"Error fetching page {page_number}: {e}")
+            if self.cancel_token.cancelled:
+                raise JobCancelled()
+            self.log(f"Error fetching page {page_number}: {e}")
+            return None
+        if content_type is None:
             return None
+        
+        data = buffer.getvalue()
+        with self.tracer.span('validate', page=page_number):
+            try:
+                # Only the header is parsed here; pixels are not decoded
+                with Image.open(io.BytesIO(data)) as img:
+                    metadata = {
+                        'url': url,
+                        'content_type': content_type,
+                        'format': img.format,
+                        'mode': img.mode,
+                        'width': img.width,
+                        'height': img.height,
+                        'dpi': img.info.get('dpi'),
+                        'bytes': len(data),
+                    }
+            except Exception as e:
+                self.log(f"Error processing image for page {page_number}: {e}")
+                return None
+        
+        metrics.PAGE_FETCH_SECONDS.observe(time.monotonic() - started)
+        metrics.PAGE_FETCH_BYTES.observe(len(data))
+        return data, metadata
     
-    def fetch_all_images(self):
-        """Fetch all images from start_page to end_page"""
+    def iter_pages(self):
+        """Yield (page number, image bytes, metadata) as each page arrives
+
+        Nothing is written to disk and only one page is held at a time.
+        Pages that fail are skipped and recorded in self.failed_pages.
+        """
+        if not self.base_image_url and not self.extract_image_url_pattern():
+            raise ValueError(f"Could not extract image URL pattern from {self.photobook_url}")
+        if self.end_page is None:
+            self.detect_total_pages()
+        
+        self.failed_pages = []
+        for page_num in range(self.start_page, self.end_page + 1):
+            self.cancel_token.raise_if_cancelled()
+            with self.tracer.span('fetch_page', page=page_num):
+                page = self.fetch_image_bytes(page_num)
+            if page is None:
+                self.failed_pages.append(page_num)
+                continue
+            
+            data, metadata = page
+            yield page_num, data, metadata
+    
+    def write_pdf(self, stream):
+        """Write the photo book as a PDF to any writable file-like object
+
+        Pages are streamed from iter_pages() straight into the PDF, with the
+        original JPEG data embedded as-is. Returns the number of pages written.
+        """
+        pages_written = 0
+        with StreamingPDFWriter(stream) as writer:
+            for page_num, data, metadata in self.iter_pages():
+                with self.tracer.span('pdf_insert', page=page_num):
+                    if metadata['format'] != 'JPEG' or metadata['mode'] not in ('RGB', 'L'):
+                        # Re-encode anything the PDF can't embed directly
+                        with Image.open(io.BytesIO(data)) as img:
+                            buffer = io.BytesIO()
+                            needed = pixel_bytes(img.width, img.height, img.mode) + pixel_bytes(img.width, img.height)
+                            with reserve_pixels(needed, self.cancel_token):
+                                img.convert('RGB').save(buffer, 'JPEG', quality=95)
+                            data = buffer.getvalue()
+                        metadata = dict(metadata, mode='RGB')
+                    
+                    dpi = metadata['dpi'][0] if metadata['dpi'] and metadata['dpi'][0] else 72
+                    writer.add_jpeg_page(data, metadata['width'], metadata['height'],
+                                         grayscale=metadata['mode'] == 'L', dpi=dpi)
+                    pages_written += 1
+        return pages_written
+    
+    def write_archive(self, stream):
+        """Write the page images as a ZIP/CBZ to any writable file-like object
+
+        Images are stored exactly as downloaded, one page at a time.
+        Returns the number of pages written.
+        """
+        with StreamingArchiveWriter(stream) as writer:
+            for page_num, data, metadata in self.iter_pages():
+                extension = 'png' if metadata['format'] == 'PNG' else 'jpg'
+                writer.add_page(page_num, data, extension)
+        return writer.pages_written
+    
+    def page_cache(self):
+        """Page cache of this book at the target width"""
+        key = self.artifact_key('pdf')
+        return PageCache(key['order_id'], key['hash'], self.target_width)
+    
+    def fetch_all_images(self, cache=None):
+        """Fetch all images from start_page to end_page
+
+        If cache (a PageCache) is given, fetched pages are stored in it with
+        the fingerprint of their tiny render, fetched alongside. A refresh
+        compares tiny renders, which a downscaled full page does not match
+        closely enough.
+        """
         if not self.base_image_url:
-            print("❌ No base image URL available. Did you run extract_image_url_pattern()?")
+            self.log("❌ No base image URL available. Did you run extract_image_url_pattern()?")
             return [], []
             
-        print(f"📚 Fetching images from page {self.start_page} to {self.end_page}")
+        self.log(f"📚 Fetching images from page {self.start_page} to {self.end_page}")
         
         successful_images = []
         failed_pages = []
+        fingerprints = {}
         
         # Progress bar
-        with tqdm(total=self.end_page - self.start_page + 1, desc="Fetching images") as pbar:
+        with ThreadPoolExecutor(max_workers=REFRESH_WORKERS) as fingerprint_pool, \
+                tqdm(total=self.end_page - self.start_page + 1, desc="Fetching images") as pbar:
             for page_num in range(self.start_page, self.end_page + 1):
-                image_path = self.fetch_image(page_num)
+                self.cancel_token.raise_if_cancelled()
+                with self.tracer.span('fetch_page', page=page_num):
+                    image_path = self.fetch_image(page_num)
                 
                 if image_path:
                     successful_images.append(image_path)
+                    if cache is not None:
+                        fingerprints[page_num] = (image_path, fingerprint_pool.submit(self._fetch_fingerprint, page_num))
+                    if self.on_page_fetched:
+                        try:
+                            self.on_page_fetched(page_num, image_path)
+                        except Exception as e:
+                            self.log(f"Warning: Page callback failed for page {page_num}: {e}")
                     pbar.set_postfix({"Success": len(successful_images), "Failed": len(failed_pages)})
                 else:
                     failed_pages.append(page_num)
                     pbar.set_postfix({"Success": len(successful_images), "Failed": len(failed_pages)})
                 
                 pbar.update(1)
-                
-                # Small delay to be respectful to the server
-                time.sleep(0.1)
+            
+            for page_num, (image_path, probe) in fingerprints.items():
+                probe = probe.result()
+                if probe:
+                    cache.put(page_num, image_path, probe[0])
         
-        print(f"\n✅ Fetch complete!")
-        print(f"Successfully fetched: {len(successful_images)} images")
-        print(f"Failed pages: {len(failed_pages)}")
+        self.log(f"\n✅ Fetch complete!")
+        self.log(f"Successfully fetched: {len(successful_images)} images")
+        self.log(f"Failed pages: {len(failed_pages)}")
         
         if failed_pages:
-            print(f"Failed page numbers: {failed_pages}")
+            self.log(f"Failed page numbers: {failed_pages}")
         
         return successful_images, failed_pages
     
+    def _insert_image_page(self, doc, image_path, index):
+        """Append one image to the PDF document as a page"""
+        import fitz
+        
+        # Open image
+        img = Image.open(image_path)
+        
+        # Decoded image, plus an RGB copy if it has to be converted
+        needed = pixel_bytes(img.width, img.height, img.mode)
+        if img.mode != 'RGB':
+            needed += pixel_bytes(img.width, img.height)
+        
+        with reserve_pixels(needed, self.cancel_token):
+            # Convert to RGB if needed
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            
+            # Save as temporary JPEG for PyMuPDF
+            temp_jpg = self._scratch_path(f"temp_{index}.jpg")
+            img.save(temp_jpg, 'JPEG', quality=95)
+            img.close()
+        
+        # Insert image into PDF
+        img_doc = fitz.open(temp_jpg)
+        pdf_bytes = img_doc.convert_to_pdf()
+        img_doc.close()
+        
+        # Insert the page
+        img_pdf = fitz.open("pdf", pdf_bytes)
+        doc.insert_pdf(img_pdf)
+        img_pdf.close()
+        
+        # Clean up temp file
+        os.remove(temp_jpg)
+    
     def create_pdf_with_pymupdf(self, image_paths, output_filename="photobook.pdf"):
         """Create PDF from list of image paths using PyMuPDF"""
         if not image_paths:
-            print("No images to create PDF from!")
+            self.log("No images to create PDF from!")
             return None
             
+        self._ensure_dirs()
         output_path = os.path.join(self.output_dir, output_filename)
         
         try:
-            print(f"📚 Creating PDF with {len(image_paths)} images...")
+            self.log(f"📚 Creating PDF with {len(image_paths)} images...")
             
-            # Sort image paths to ensure correct order
-            image_paths.sort()
+            # Sort image paths to ensure correct order (scratch files may span directories)
+            image_paths.sort(key=os.path.basename)
             
             # Try using PyMuPDF for PDF creation
             try:
@@ -257,97 +874,398 @@ class CEWEPhotoBookFetcher:
                 # Create a new PDF document
                 doc = fitz.open()
                 
-                for i, image_path in enumerate(tqdm(image_paths, desc="Adding pages to PDF")):
-                    # Open image
-                    img = Image.open(image_path)
-                    
-                    # Convert to RGB if needed
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    
-                    # Save as temporary JPEG for PyMuPDF
-                    temp_jpg = f"temp_{i}.jpg"
-                    img.save(temp_jpg, 'JPEG', quality=95)
-                    img.close()
-                    
-                    # Insert image into PDF
-                    img_doc = fitz.open(temp_jpg)
-                    pdf_bytes = img_doc.convert_to_pdf()
-                    img_doc.close()
-                    
-                    # Insert the page
-                    img_pdf = fitz.open("pdf", pdf_bytes)
-                    doc.insert_pdf(img_pdf)
-                    img_pdf.close()
+                try:
+                    for i, image_path in enumerate(tqdm(image_paths, desc="Adding pages to PDF")):
+                        self.cancel_token.raise_if_cancelled()
+                        page_started = time.monotonic()
+                        
+                        with self.tracer.span('pdf_insert', page=i + 1):
+                            self._insert_image_page(doc, image_path, i)
+                        metrics.PDF_PAGE_SECONDS.observe(time.monotonic() - page_started, builder='fetcher')
                     
-                    # Clean up temp file
-                    os.remove(temp_jpg)
-                
-                # Save the final PDF
-                doc.save(output_path)
-                doc.close()
+                    # Save the final PDF
+                    doc.save(output_path)
+                finally:
+                    doc.close()
                 
             except ImportError:
                 # Fallback: if PyMuPDF is not available, inform user
-                print("❌ PyMuPDF not available for advanced PDF creation")
+                self.log("❌ PyMuPDF not available for advanced PDF creation")
                 return None
             
-            print(f"✅ PDF created successfully: {output_path}")
+            self.log(f"✅ PDF created successfully: {output_path}")
             return output_path
             
+        except JobCancelled:
+            raise
         except Exception as e:
-            print(f"❌ Error creating PDF: {e}")
+            self.log(f"❌ Error creating PDF: {e}")
             return None
     
-    def run(self, output_filename=None):
-        """Main execution method"""
-        print("🚀 Starting Enhanced CEWE Photo Book Fetcher")
-        print(f"📖 Photo book URL: {self.photobook_url}")
+    def artifact_key(self, profile):
+        """Key of this run's output in the artifact store"""
+        params = parse_qs(urlparse(self.source_image_url or '').query)
+        order_id = params.get('orderId', [''])[0]
+        # Without orderId/hash in the image URL, the share URL identifies the book
+        book_hash = params.get('hash', [''])[0] or self.photobook_url
+        return artifact_key(order_id, book_hash, self.target_width, self.start_page, self.end_page, profile)
+    
+    def output_filename(self, output_filename=None, extension='pdf', profile=None):
+        """Sanitised output file name; deterministic per book and options if not given"""
+        if not output_filename:
+            return ArtifactStore(self.output_dir).default_filename(self.artifact_key(profile or extension), extension)
         
-        # Extract image URL pattern
-        if not self.extract_image_url_pattern():
-            print("❌ Failed to extract image URL pattern")
+        # Remove or replace invalid characters
+        output_filename = re.sub(r'[<>:"/\\|?*]', '_', output_filename)
+        # Ensure the extension
+        if not output_filename.lower().endswith(f'.{extension}'):
+            output_filename += f'.{extension}'
+        return output_filename
+    
+    def _produce(self, profile, output_filename, build, extension=None):
+        """Return the path of this run's artifact, building it only if needed
+
+        A complete artifact from an earlier identical run is reused, and an
+        identical run already in progress (in any thread) is joined instead
+        of fetching the book a second time. build(filename) creates the file
+        and returns its path. extension defaults to the profile.
+        """
+        store = ArtifactStore(self.output_dir)
+        key = self.artifact_key(profile)
+        extension = extension or profile
+        
+        def produce():
+            stored = store.lookup(key) if self.reuse_artifacts else None
+            if stored:
+                self.log(f"♻️  Reusing existing {profile.upper()}: {stored['path']}")
+                return stored['path']
+            
+            path = build(self.output_filename(output_filename, extension, profile))
+            # Only complete outputs are worth handing to the next identical request
+            if path and not self.failed_pages:
+                store.commit(key, path, url=self.photobook_url, pages=self.end_page - self.start_page + 1)
+            return path
+        
+        path, shared = JOB_FLIGHTS.do(key_digest(key), produce, self.cancel_token)
+        if shared:
+            self.log(f"🤝 Joined an identical {profile.upper()} job that was already running")
+        if path and output_filename:
+            wanted = self.output_filename(output_filename, extension, profile)
+            if os.path.basename(path) != wanted:
+                path = store.deliver(path, wanted)
+        return path
+    
+    def export_archive(self, output_filename=None, archive_format='zip'):
+        """Fetch the pages straight into a ZIP/CBZ in the output directory"""
+        try:
+            if not self.base_image_url and not self.extract_image_url_pattern():
+                self.log("❌ Failed to extract image URL pattern")
+                return False
+            if self.end_page is None:
+                self.detect_total_pages()
+            
+            output_path = self._produce(archive_format, output_filename, self._build_archive)
+        except JobCancelled:
+            self.log("🛑 Export cancelled, stopping")
             return False
         
-        print(f"📄 Pages: {self.start_page} to {self.end_page}")
-        print(f"📐 Image width: {self.target_width}px")
+        if not output_path:
+            return False
         
-        # Fetch all images
-        successful_images, failed_pages = self.fetch_all_images()
+        self.output_path = output_path
+        self.log(f"\n🎉 Success! {archive_format.upper()} created: {output_path}")
+        self.log(f"📁 File size: {os.path.getsize(output_path) / (1024*1024):.2f} MB")
+        return True
+    
+    def _build_archive(self, filename):
+        """Write the page archive under filename in the output directory"""
+        self._ensure_dirs()
+        output_path = os.path.join(self.output_dir, filename)
+        self.log(f"📦 Writing pages {self.start_page} to {self.end_page} to {output_path}")
         
-        if not successful_images:
-            print("❌ No images were successfully fetched. Cannot create PDF.")
+        try:
+            with open(output_path, 'wb') as f:
+                pages_written = self.write_archive(f)
+        except JobCancelled:
+            os.remove(output_path)
+            raise
+        
+        if not pages_written:
+            os.remove(output_path)
+            self.log("❌ No images were successfully fetched.")
+            return None
+        
+        self.log(f"📊 Pages: {pages_written}, failed: {len(self.failed_pages)}")
+        return output_path
+    
+    def run_variants(self, variants, output_filename=None, start_spread_page=SPREAD_START_PAGE, workers=None):
+        """Fetch the book once and build every variant from the same pages
+        
+        variants is a list of (layout, width) pairs as returned by
+        variants.parse_variant(); width None means the fetched width. Pages
+        are fetched at the widest requested width and each variant PDF is
+        built in its own worker process. Returns {(layout, width): path}.
+        """
+        try:
+            return self._run_variants(variants, output_filename, start_spread_page, workers)
+        except JobCancelled:
+            self.log("🛑 Fetch cancelled, stopping")
+            return {}
+    
+    def _run_variants(self, variants, output_filename, start_spread_page, workers):
+        widths = [width for _, width in variants if width]
+        if self.target_width != NATIVE_WIDTH and widths:
+            self.target_width = max([self.target_width] + widths)
+        
+        if not (self.base_image_url and self.end_page is not None) and not self.extract_image_url_pattern():
+            self.log("❌ Failed to extract image URL pattern")
+            return {}
+        self.resolve_native_width()
+        self.log(f"📐 Fetching once at {self.target_width}px for {len(variants)} variants")
+        
+        # The first variant that needs pages fetches them; the others wait for that
+        fetch_lock = threading.Lock()
+        fetched = []
+        
+        def fetch_pages():
+            with fetch_lock:
+                if not fetched:
+                    cache = self.page_cache()
+                    with self.tracer.span('fetch_all_images'):
+                        images, self.failed_pages = self.fetch_all_images(cache)
+                    cache.save()
+                    fetched.append(sorted(images, key=os.path.basename))
+                return fetched[0]
+        
+        def produce(pool, layout, width):
+            # Widths at or above the fetched width are the full-width pages
+            width = width if width and width < self.target_width else None
+            
+            def build(filename):
+                image_paths = fetch_pages()
+                if not image_paths:
+                    return None
+                self._ensure_dirs()
+                self.log(f"📚 Building {layout} variant at {width or self.target_width}px: {filename}")
+                # The worker process has a governor of its own; this process's
+                # budget only accounts for the build if it is reserved here
+                needed = peak_pixel_bytes(image_paths, layout, width, start_spread_page)
+                with self.tracer.span('build_variant', layout=layout, width=width or self.target_width), \
+                        reserve_pixels(needed, self.cancel_token):
+                    future = pool.submit(build_variant, image_paths, os.path.join(self.output_dir, filename),
+                                         layout, width, start_spread_page)
+                    wait_for([future], self.cancel_token)
+                    return future.result()
+            
+            suffix = variant_suffix(layout, width)
+            if output_filename and suffix:
+                name = self.output_filename(output_filename)[:-len('.pdf')] + f"_{suffix}"
+            else:
+                name = output_filename
+            return self._produce(variant_profile(layout, width, start_spread_page), name, build, 'pdf')
+        
+        workers = workers or min(len(variants), os.cpu_count() or 1)
+        # Spawned rather than forked: a fork could copy a lock another thread holds
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            with ThreadPoolExecutor(max_workers=len(variants)) as threads:
+                futures = {variant: threads.submit(produce, pool, *variant) for variant in variants}
+                wait_for(futures.values(), self.cancel_token)
+                results = {variant: future.result() for variant, future in futures.items()}
+        finally:
+            # A cancelled job doesn't wait for builds still running in the workers
+            pool.shutdown(wait=not self.cancel_token.cancelled, cancel_futures=True)
+        
+        self.output_path = next((path for path in results.values() if path), None)
+        for (layout, width), path in results.items():
+            label = f"{layout} @ {width or self.target_width}px"
+            if path:
+                self.log(f"✅ {label}: {path} ({os.path.getsize(path) / (1024*1024):.2f} MB)")
+            else:
+                self.log(f"❌ {label}: failed")
+        return results
+    
+    def _fetch_fingerprint(self, page_number):
+        """Fingerprint a tiny render of a page; returns (fingerprint, bytes) or None"""
+        url = self.build_page_url(page_number, width=FINGERPRINT_WIDTH)
+        self.cancel_token.raise_if_cancelled()
+        with self.tracer.span('fingerprint_page', page=page_number) as span:
+            try:
+                response = self.request('GET', url, timeout=30)
+                span.set(status=response.status_code, bytes=len(response.content))
+                if response.status_code != 200 or not response.headers.get('content-type', '').startswith('image/'):
+                    return None
+                with Image.open(io.BytesIO(response.content)) as img:
+                    return fingerprint(img), len(response.content)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                self.log(f"Warning: Could not fingerprint page {page_number}: {e}")
+                return None
+    
+    def refresh(self, output_filename=None):
+        """Re-sync a book, downloading full pages only where the content changed
+
+        Every page is fetched as a tiny render and fingerprinted. Pages whose
+        fingerprint matches the page cache are taken from it; the others are
+        downloaded at full width and cached for the next refresh.
+        """
+        try:
+            return self._refresh(output_filename)
+        except JobCancelled:
+            self.log("🛑 Refresh cancelled, stopping")
+            return False
+    
+    def _refresh(self, output_filename=None):
+        self.log("🔄 Refreshing CEWE photo book")
+        self.log(f"📖 Photo book URL: {self.photobook_url}")
+        
+        if not (self.base_image_url and self.end_page is not None) and not self.extract_image_url_pattern():
+            self.log("❌ Failed to extract image URL pattern")
             return False
+        self.resolve_native_width()
         
-        # Generate output filename if not provided
-        if not output_filename:
-            # Extract some identifier from the URL for filename
-            url_hash = abs(hash(self.photobook_url)) % 100000
-            output_filename = f"cewe_photobook_{url_hash}.pdf"
-        else:
-            # Sanitize filename and ensure .pdf extension
-            import re
-            # Remove or replace invalid characters
-            output_filename = re.sub(r'[<>:"/\\|?*]', '_', output_filename)
-            # Ensure .pdf extension
-            if not output_filename.lower().endswith('.pdf'):
-                output_filename += '.pdf'
+        cache = self.page_cache()
+        pages = list(range(self.start_page, self.end_page + 1))
         
-        # Create PDF
-        pdf_path = self.create_pdf_with_pymupdf(successful_images, output_filename)
+        self.log(f"🔍 Fingerprinting {len(pages)} pages at {FINGERPRINT_WIDTH}px...")
+        with self.tracer.span('fingerprint_pages', pages=len(pages)):
+            with ThreadPoolExecutor(max_workers=REFRESH_WORKERS) as pool:
+                probes = dict(zip(pages, pool.map(self._fetch_fingerprint, pages)))
+        
+        page_paths = []
+        self.failed_pages = []
+        unchanged = 0
+        changed_bytes = 0
+        for page_num in tqdm(pages, desc="Refreshing pages"):
+            self.cancel_token.raise_if_cancelled()
+            probe = probes[page_num]
+            cached = cache.get(page_num)
+            if probe and cached and fingerprint_distance(probe[0], cached[1]) <= FINGERPRINT_THRESHOLD:
+                page_paths.append(cached[0])
+                unchanged += 1
+                continue
+            
+            with self.tracer.span('fetch_page', page=page_num):
+                image_path = self.fetch_image(page_num)
+            if not image_path:
+                self.failed_pages.append(page_num)
+                continue
+            changed_bytes += os.path.getsize(image_path)
+            # Without a fingerprint the page can't be compared next time, so don't cache it
+            page_paths.append(cache.put(page_num, image_path, probe[0]) if probe else image_path)
+        cache.save()
+        
+        probe_bytes = sum(probe[1] for probe in probes.values() if probe)
+        self.log(f"✅ {unchanged} pages unchanged, {len(page_paths) - unchanged} downloaded again, "
+                 f"{len(self.failed_pages)} failed")
+        self.log(f"📡 Transferred {probe_bytes / 1024:.0f} KB of fingerprints and "
+                 f"{changed_bytes / (1024 * 1024):.2f} MB of full pages")
+        
+        if not page_paths:
+            self.log("❌ No pages available. Cannot create PDF.")
+            return False
+        
+        # The whole point is to pick up changes, so never reuse the old PDF
+        self.reuse_artifacts = False
+        pdf_path = self._produce('pdf', output_filename,
+                                 lambda filename: self.create_pdf_with_pymupdf(page_paths, filename))
+        if not pdf_path:
+            self.log("\n❌ Failed to create PDF")
+            return False
+        
+        self.output_path = pdf_path
+        self.log(f"\n🎉 Success! PDF refreshed: {pdf_path}")
+        return True
+    
+    def run(self, output_filename=None):
+        """Main execution method"""
+        try:
+            return self._run(output_filename)
+        except JobCancelled:
+            self.log("🛑 Fetch cancelled, stopping")
+            return False
+    
+    def _run(self, output_filename=None):
+        """Run the full fetch pipeline, raising JobCancelled when stopped"""
+        self.log("🚀 Starting Enhanced CEWE Photo Book Fetcher")
+        self.log(f"📖 Photo book URL: {self.photobook_url}")
+        
+        # Extract image URL pattern (skipped when a warm analysis was loaded)
+        if self.base_image_url and self.end_page is not None:
+            self.log("⚡ Reusing cached photo book analysis")
+            self.resolve_native_width()
+        elif not self.extract_image_url_pattern():
+            self.log("❌ Failed to extract image URL pattern")
+            return False
+        
+        self.log(f"📄 Pages: {self.start_page} to {self.end_page}")
+        self.log(f"📐 Image width: {self.target_width}px")
+        
+        pdf_path = self._produce('pdf', output_filename, self._build_pdf)
         
         if pdf_path:
-            print(f"\n🎉 Success! PDF created: {pdf_path}")
-            print(f"📊 Total pages in PDF: {len(successful_images)}")
+            self.output_path = pdf_path
+            self.log(f"\n🎉 Success! PDF created: {pdf_path}")
             
             # File size
             file_size = os.path.getsize(pdf_path)
-            print(f"📁 File size: {file_size / (1024*1024):.2f} MB")
+            self.log(f"📁 File size: {file_size / (1024*1024):.2f} MB")
             
             return True
         else:
-            print("\n❌ Failed to create PDF")
+            self.log("\n❌ Failed to create PDF")
             return False
+    
+    def _build_pdf(self, filename):
+        """Fetch all pages and assemble them into a PDF under filename"""
+        # Fetch all images, keeping them in the page cache for a later --refresh
+        started = time.monotonic()
+        cache = self.page_cache()
+        with self.tracer.span('fetch_all_images'):
+            successful_images, self.failed_pages = self.fetch_all_images(cache)
+        cache.save()
+        fetch_seconds = time.monotonic() - started
+        
+        if not successful_images:
+            self.log("❌ No images were successfully fetched. Cannot create PDF.")
+            return None
+        
+        # Create PDF
+        started = time.monotonic()
+        with self.tracer.span('create_pdf', pages=len(successful_images)):
+            pdf_path = self.create_pdf_with_pymupdf(successful_images, filename)
+        
+        if pdf_path:
+            self.log(f"📊 Total pages in PDF: {len(successful_images)}")
+            self.record_rates(successful_images, fetch_seconds, time.monotonic() - started, pdf_path)
+        return pdf_path
+    
+    def record_rates(self, image_paths, fetch_seconds, assemble_seconds, pdf_path):
+        """Add this run's per-page rates to the job history used by cost estimates"""
+        try:
+            download_bytes = sum(os.path.getsize(path) for path in image_paths)
+            JobHistory().record_fetch(len(image_paths), download_bytes, fetch_seconds, assemble_seconds,
+                                      os.path.getsize(pdf_path))
+        except (OSError, ValueError) as e:
+            self.log(f"Warning: Could not record job rates: {e}")
+
+
+def parse_width(value):
+    """argparse type for --width: a pixel count or 'native'"""
+    if value == NATIVE_WIDTH:
+        return value
+    return int(value)
+
+
+def parse_variant_arg(value):
+    """argparse type for --variant"""
+    import argparse
+    
+    try:
+        return parse_variant(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
 
 def main():
@@ -359,11 +1277,26 @@ def main():
                         help="Start page number (default: 1)")
     parser.add_argument("-e", "--end-page", type=int, default=None,
                         help="End page number (default: auto-detect)")
-    parser.add_argument("-w", "--width", type=int, default=1080,
-                        help="Image width in pixels (default: 1080)")
+    parser.add_argument("-w", "--width", type=parse_width, default=DEFAULT_WIDTH,
+                        help="Image width in pixels, or 'native' to probe the book's native resolution (default: 1080)")
     parser.add_argument("-o", "--output", help="Output filename (default: auto-generated)")
+    parser.add_argument("-f", "--format", choices=["pdf", "zip", "cbz"], default="pdf",
+                        help="Output format: PDF, or a ZIP/CBZ of the original page images (default: pdf)")
+    parser.add_argument("--variant", action="append", type=parse_variant_arg, dest="variants",
+                        help="Build this variant from the same fetch, repeatable: pages, spreads, "
+                             "WIDTH or LAYOUT@WIDTH, e.g. --variant pages --variant spreads@1080")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Re-download only pages that changed since the last refresh (PDF only)")
+    parser.add_argument("--force", action="store_true",
+                        help="Fetch again even if an identical output already exists")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the run and save reports next to the output PDF")
     
     args = parser.parse_args()
+    if args.refresh and args.format != 'pdf':
+        parser.error("--refresh only supports the pdf format")
+    if args.variants and (args.refresh or args.format != 'pdf'):
+        parser.error("--variant only supports the pdf format without --refresh")
     
     # Create fetcher and run
     fetcher = CEWEPhotoBookFetcher(
@@ -372,13 +1305,34 @@ def main():
         end_page=args.end_page,
         target_width=args.width
     )
+    fetcher.reuse_artifacts = not args.force
+    
+    def run():
+        if args.refresh:
+            return fetcher.refresh(args.output)
+        if args.variants:
+            results = fetcher.run_variants(list(dict.fromkeys(args.variants)), args.output)
+            return bool(results) and all(results.values())
+        if args.format == 'pdf':
+            return fetcher.run(args.output)
+        return fetcher.export_archive(args.output, args.format)
     
-    success = fetcher.run(args.output)
+    if args.profile:
+        from profiling import JobProfiler, profile_output_base
+        
+        with JobProfiler() as profiler:
+            success = run()
+        
+        base = profile_output_base(fetcher.output_path or os.path.join(fetcher.output_dir, "cewe_photobook"))
+        for path in profiler.save(base):
+            print(f"📈 Profile written: {path}")
+    else:
+        success = run()
     
     if success:
-        print("\n🎉 Photo book PDF created successfully!")
+        print(f"\n🎉 Photo book {args.format.upper()} created successfully!")
     else:
-        print("\n😞 Failed to create photo book PDF.")
+        print(f"\n😞 Failed to create photo book {args.format.upper()}.")
         sys.exit(1)
 
 
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Pre-flight job cost estimates
+Estimates pages, download size, processing time and output size of a job
+before it runs, from sampled page sizes and per-page rates recorded by
+earlier jobs, so the scheduler can run short jobs first and turn away work
+it cannot finish in reasonable time
+"""
+
+import json
+import os
+import threading
+import time
+
+
+JOB_HISTORY_PATH = os.environ.get('CEWE_JOB_HISTORY', os.path.join("output", ".job_history.json"))
+HISTORY_WEIGHT = 0.3  # weight of the newest job in the moving averages
+COST_SAMPLE_PAGES = 5  # pages whose size is sampled with HEAD requests
+REFERENCE_DPI = 300    # spread rates are stored per page at this DPI
+
+# Used until jobs of that kind have been recorded
+DEFAULT_RATES = {
+    'fetch_seconds_per_page': 0.5,
+    'assemble_seconds_per_page': 0.05,
+    'output_bytes_per_download_byte': 1.0,
+    'spread_seconds_per_page': 1.5,
+}
+
+_history_lock = threading.Lock()
+
+
+class JobHistory:
+    """Moving averages of per-page rates, kept in a small JSON file"""
+
+    def __init__(self, path=JOB_HISTORY_PATH):
+        self.path = path
+        self.load()
+
+    def load(self):
+        """Read the rates saved by earlier jobs (defaults where there are none)"""
+        self.rates = dict(DEFAULT_RATES)
+        self.jobs = {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.rates.update(data.get('rates', {}))
+            self.jobs = data.get('jobs', {})
+        except (OSError, ValueError):
+            pass
+
+    def rate(self, name):
+        return self.rates[name]
+
+    def _update(self, name, value):
+        if name in self.rates and self.jobs.get(name):
+            self.rates[name] += HISTORY_WEIGHT * (value - self.rates[name])
+        else:
+            self.rates[name] = value
+        self.jobs[name] = self.jobs.get(name, 0) + 1
+
+    def record_fetch(self, pages, download_bytes, fetch_seconds, assemble_seconds, output_bytes):
+        """Fold a finished fetch job into the rates and save them"""
+        if pages <= 0:
+            return
+        with _history_lock:
+            # Another job may have saved since this one read the file
+            self.load()
+            self._update('fetch_seconds_per_page', fetch_seconds / pages)
+            self._update('assemble_seconds_per_page', assemble_seconds / pages)
+            if download_bytes:
+                self._update('output_bytes_per_download_byte', output_bytes / download_bytes)
+            self.save()
+
+    def record_spreads(self, pages, dpi, seconds):
+        """Fold a finished spread job into the rates and save them"""
+        if pages <= 0:
+            return
+        with _history_lock:
+            self.load()
+            self._update('spread_seconds_per_page', seconds / pages / (dpi / REFERENCE_DPI) ** 2)
+            self.save()
+
+    def save(self):
+        """Write the rates atomically"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp, 'w') as f:
+            json.dump({'rates': self.rates, 'jobs': self.jobs, 'updated_at': time.time()}, f, indent=2)
+        os.replace(temp, self.path)
+
+
+def estimate_fetch(page_count, page_sizes, history=None):
+    """Cost of fetching page_count pages, given {page: bytes} of sampled pages"""
+    history = history or JobHistory()
+    sizes = [size for size in page_sizes.values() if size]
+    page_bytes = sum(sizes) // len(sizes) if sizes else None
+    download_bytes = page_bytes * page_count if page_bytes else None
+    fetch_seconds = page_count * history.rate('fetch_seconds_per_page')
+    cpu_seconds = page_count * history.rate('assemble_seconds_per_page')
+    return {
+        'pages': page_count,
+        'sampled_pages': len(sizes),
+        'page_bytes': page_bytes,
+        'download_bytes': download_bytes,
+        'output_bytes': int(download_bytes * history.rate('output_bytes_per_download_byte')) if download_bytes else None,
+        'cpu_seconds': round(cpu_seconds, 1),
+        'seconds': round(fetch_seconds + cpu_seconds, 1),
+        'history_jobs': history.jobs.get('fetch_seconds_per_page', 0),
+    }
+
+
+def estimate_spreads(page_count, dpi, history=None):
+    """Cost of turning a page_count page PDF into spreads at dpi"""
+    history = history or JobHistory()
+    seconds = page_count * history.rate('spread_seconds_per_page') * (dpi / REFERENCE_DPI) ** 2
+    return {
+        'pages': page_count,
+        'cpu_seconds': round(seconds, 1),
+        'seconds': round(seconds, 1),
+        'history_jobs': history.jobs.get('spread_seconds_per_page', 0),
+    }
+
+
+def scale_estimate(estimate, page_count, pixel_scale=1.0):
+    """estimate rescaled to page_count pages with pixel_scale times the pixels per page
+
+    JPEG size grows roughly with pixel count; times are per page.
+    """
+    pages = estimate['pages'] or 1
+    scaled = dict(estimate, pages=page_count)
+    if estimate.get('page_bytes'):
+        scaled['page_bytes'] = int(estimate['page_bytes'] * pixel_scale)
+    for key in ('download_bytes', 'output_bytes'):
+        if estimate.get(key):
+            scaled[key] = int(estimate[key] * pixel_scale * page_count / pages)
+    for key in ('cpu_seconds', 'seconds'):
+        scaled[key] = round(estimate[key] * page_count / pages, 1)
+    return scaled
+
+
+def describe_estimate(estimate):
+    """One-line human summary of an estimate"""
+    parts = [f"{estimate['pages']} pages"]
+    if estimate.get('download_bytes'):
+        parts.append(f"~{estimate['download_bytes'] / (1024 * 1024):.1f} MB to download")
+    if estimate.get('output_bytes'):
+        parts.append(f"~{estimate['output_bytes'] / (1024 * 1024):.1f} MB output")
+    parts.append(f"~{estimate['seconds']:.0f}s")
+    return ", ".join(parts)
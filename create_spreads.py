@@ -7,21 +7,42 @@ Converts a PDF to spread format where consecutive pages are combined side by sid
 import os
 import sys
 import argparse
+import time
 from PIL import Image
 import fitz  # PyMuPDF
 from tqdm import tqdm
 
+import metrics
+from cancellation import CancellationToken, JobCancelled
+from cost_estimator import JobHistory
+from memory_governor import pixel_bytes, reserve_pixels
+from raster_cache import RasterCache, file_digest
+from scratch import JobScratch
+from spread_layout import SPREAD_START_PAGE, compose_spread, spread_groups
+from tracing import NULL_TRACER
+
 
 class PDFSpreadCreator:
-    def __init__(self, input_pdf, output_pdf=None, start_spread_page=2, dpi=300):
+    def __init__(self, input_pdf, output_pdf=None, start_spread_page=SPREAD_START_PAGE, dpi=300, cancel_token=None,
+                 tracer=None, scratch=None, raster_cache=True):
         self.input_pdf = input_pdf
         self.output_pdf = output_pdf or self._generate_output_name()
         self.start_spread_page = start_spread_page
         self.dpi = dpi
+        self.cancel_token = cancel_token or CancellationToken()
+        self.tracer = tracer or NULL_TRACER
+        
+        # Per-job scratch space for rendered pages and spreads (RAM first, then disk)
+        self.scratch = scratch or JobScratch('spreads', "temp_spreads")
         
-        # Create temporary directory for images
-        self.temp_dir = "temp_spreads"
-        os.makedirs(self.temp_dir, exist_ok=True)
+        # Rendered pages shared between runs on the same PDF at the same DPI
+        if raster_cache is True:
+            raster_cache = RasterCache()
+        self.raster_cache = raster_cache or None
+        # Pages of the last extraction that came from the raster cache
+        self.cached_pages = 0
+        # Keeps this run's rendered pages from being evicted while it runs
+        self.raster_pin = None
         
         # Ensure output directory exists
         os.makedirs(os.path.dirname(self.output_pdf) if os.path.dirname(self.output_pdf) else ".", exist_ok=True)
@@ -35,62 +56,84 @@ class PDFSpreadCreator:
         """Extract all pages from PDF as high-quality images"""
         print("📄 Extracting pages from PDF...")
         
+        pdf_digest = file_digest(self.input_pdf) if self.raster_cache else None
+        if self.raster_cache and not self.raster_pin:
+            self.raster_pin = self.raster_cache.pin(pdf_digest, self.dpi)
         doc = fitz.open(self.input_pdf)
         page_images = []
+        cached_pages = 0
         
-        for page_num in tqdm(range(len(doc)), desc="Extracting pages"):
-            page = doc[page_num]
-            
-            # Get page as image with high DPI
-            mat = fitz.Matrix(self.dpi / 72, self.dpi / 72)  # 72 is default DPI
-            pix = page.get_pixmap(matrix=mat)
-            
-            # Save as temporary image
-            temp_path = os.path.join(self.temp_dir, f"page_{page_num + 1:03d}.png")
-            pix.save(temp_path)
-            page_images.append(temp_path)
+        try:
+            for page_num in tqdm(range(len(doc)), desc="Extracting pages"):
+                self.cancel_token.raise_if_cancelled()
+                page_started = time.monotonic()
+                
+                if self.raster_cache:
+                    cached = self.raster_cache.get(pdf_digest, page_num, self.dpi)
+                    if cached:
+                        page_images.append(cached)
+                        cached_pages += 1
+                        continue
+                
+                page = doc[page_num]
+                scale = self.dpi / 72  # 72 is default DPI
+                needed = pixel_bytes(page.rect.width * scale + 1, page.rect.height * scale + 1)
+                with self.tracer.span('render_page', page=page_num + 1) as span, \
+                        reserve_pixels(needed, self.cancel_token):
+                    # Get page as image with high DPI
+                    mat = fitz.Matrix(scale, scale)
+                    pix = page.get_pixmap(matrix=mat)
+                    
+                    if self.raster_cache:
+                        temp_path = self.raster_cache.put(pdf_digest, page_num, self.dpi, pix.save)
+                    else:
+                        # Save as temporary image
+                        temp_path = self.scratch.path(f"page_{page_num + 1:03d}.png")
+                        pix.save(temp_path)
+                        temp_path = self.scratch.record(temp_path)
+                    # Free the bitmap before giving its memory back
+                    pix = None
+                    span.set(bytes=os.path.getsize(temp_path))
+                page_images.append(temp_path)
+                metrics.SPREAD_PAGE_SECONDS.observe(time.monotonic() - page_started, stage='extract')
+        finally:
+            doc.close()
         
-        doc.close()
+        self.cached_pages = cached_pages
+        if cached_pages:
+            print(f"♻️  Reused {cached_pages} rendered pages from the raster cache")
         print(f"✅ Extracted {len(page_images)} pages")
         return page_images
     
     def create_spread(self, left_page_path, right_page_path, output_path):
         """Create a spread by combining two pages side by side"""
-        # Open both images
+        # Open both images (only the headers are read until the pixels are used)
         left_img = Image.open(left_page_path)
         right_img = Image.open(right_page_path)
         
         # Ensure both images are the same height
         max_height = max(left_img.height, right_img.height)
         
-        # Resize if needed to match heights
-        if left_img.height != max_height:
-            left_img = left_img.resize((
-                int(left_img.width * max_height / left_img.height),
-                max_height
-            ), Image.Resampling.LANCZOS)
-        
-        if right_img.height != max_height:
-            right_img = right_img.resize((
-                int(right_img.width * max_height / right_img.height),
-                max_height
-            ), Image.Resampling.LANCZOS)
+        # Decoded pages, resized copies and the spread can all be alive at once
+        left_width = int(left_img.width * max_height / left_img.height)
+        right_width = int(right_img.width * max_height / right_img.height)
+        needed = pixel_bytes(left_img.width, left_img.height, left_img.mode)
+        needed += pixel_bytes(right_img.width, right_img.height, right_img.mode)
+        needed += pixel_bytes(left_width, max_height) if left_img.height != max_height else 0
+        needed += pixel_bytes(right_width, max_height) if right_img.height != max_height else 0
+        needed += pixel_bytes(left_width + right_width, max_height)
         
-        # Create new image with combined width
-        spread_width = left_img.width + right_img.width
-        spread_img = Image.new('RGB', (spread_width, max_height), 'white')
-        
-        # Paste both images
-        spread_img.paste(left_img, (0, 0))
-        spread_img.paste(right_img, (left_img.width, 0))
-        
-        # Save the spread
-        spread_img.save(output_path, 'PNG', quality=95)
-        
-        # Clean up
-        left_img.close()
-        right_img.close()
-        spread_img.close()
+        with reserve_pixels(needed, self.cancel_token):
+            # Scale to matching heights and place side by side
+            spread_img = compose_spread([left_img, right_img])
+            
+            # Save the spread
+            spread_img.save(output_path, 'PNG', quality=95)
+            
+            # Clean up
+            left_img.close()
+            right_img.close()
+            spread_img.close()
         
         return output_path
     
@@ -103,32 +146,67 @@ class PDFSpreadCreator:
         
         final_pages = []
         
-        # Handle pages before spread starts (individual pages)
-        for i in range(min(self.start_spread_page - 1, len(page_images))):
-            final_pages.append(page_images[i])
-            print(f"📄 Added single page: {i + 1}")
-        
-        # Handle spread pages (pairs)
+        # Single pages before the spreads start and at an odd end, pairs in between
         spread_count = 0
-        for i in range(self.start_spread_page - 1, len(page_images), 2):
-            if i + 1 < len(page_images):
+        for group in spread_groups(len(page_images), self.start_spread_page):
+            self.cancel_token.raise_if_cancelled()
+            i = group[0]
+            if len(group) == 2:
                 # Create spread from two pages
                 left_page = page_images[i]
                 right_page = page_images[i + 1]
                 
-                spread_path = os.path.join(self.temp_dir, f"spread_{spread_count:03d}.png")
-                self.create_spread(left_page, right_page, spread_path)
+                spread_path = self.scratch.path(f"spread_{spread_count:03d}.png")
+                spread_started = time.monotonic()
+                with self.tracer.span('compose_spread', pages=f"{i + 1}-{i + 2}") as span:
+                    self.create_spread(left_page, right_page, spread_path)
+                    span.set(bytes=os.path.getsize(spread_path))
+                    spread_path = self.scratch.record(spread_path)
+                # Two input pages per spread
+                metrics.SPREAD_PAGE_SECONDS.observe((time.monotonic() - spread_started) / 2, stage='compose')
                 final_pages.append(spread_path)
                 spread_count += 1
                 
                 print(f"📖 Created spread: pages {i + 1}-{i + 2}")
             else:
-                # Odd page at the end, add as single page
                 final_pages.append(page_images[i])
-                print(f"📄 Added final single page: {i + 1}")
+                print(f"📄 Added single page: {i + 1}")
         
         return final_pages
     
+    def _insert_image_page(self, doc, image_path, index):
+        """Append one image to the PDF document as a page"""
+        # Open image
+        img = Image.open(image_path)
+        
+        # Decoded image, plus an RGB copy if it has to be converted
+        needed = pixel_bytes(img.width, img.height, img.mode)
+        if img.mode != 'RGB':
+            needed += pixel_bytes(img.width, img.height)
+        
+        with reserve_pixels(needed, self.cancel_token):
+            # Convert to RGB if needed
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            
+            # Save as temporary JPEG for PyMuPDF
+            temp_jpg = self.scratch.path(f"temp_{index}.jpg")
+            img.save(temp_jpg, 'JPEG', quality=95)
+            img.close()
+        
+        # Insert image into PDF
+        img_doc = fitz.open(temp_jpg)
+        pdf_bytes = img_doc.convert_to_pdf()
+        img_doc.close()
+        
+        # Insert the page
+        img_pdf = fitz.open("pdf", pdf_bytes)
+        doc.insert_pdf(img_pdf)
+        img_pdf.close()
+        
+        # Clean up temp file
+        os.remove(temp_jpg)
+    
     def create_pdf_with_pymupdf(self, image_paths):
         """Create final PDF using PyMuPDF instead of img2pdf"""
         print("📚 Creating final PDF...")
@@ -137,39 +215,25 @@ class PDFSpreadCreator:
             # Create a new PDF document
             doc = fitz.open()
             
-            for i, image_path in enumerate(tqdm(image_paths, desc="Adding pages to PDF")):
-                # Open image
-                img = Image.open(image_path)
-                
-                # Convert to RGB if needed
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
+            try:
+                for i, image_path in enumerate(tqdm(image_paths, desc="Adding pages to PDF")):
+                    self.cancel_token.raise_if_cancelled()
+                    page_started = time.monotonic()
+                    
+                    with self.tracer.span('pdf_insert', page=i + 1):
+                        self._insert_image_page(doc, image_path, i)
+                    metrics.PDF_PAGE_SECONDS.observe(time.monotonic() - page_started, builder='spreads')
                 
-                # Save as temporary JPEG for PyMuPDF
-                temp_jpg = os.path.join(self.temp_dir, f"temp_{i}.jpg")
-                img.save(temp_jpg, 'JPEG', quality=95)
-                img.close()
-                
-                # Insert image into PDF
-                img_doc = fitz.open(temp_jpg)
-                pdf_bytes = img_doc.convert_to_pdf()
-                img_doc.close()
-                
-                # Insert the page
-                img_pdf = fitz.open("pdf", pdf_bytes)
-                doc.insert_pdf(img_pdf)
-                img_pdf.close()
-                
-                # Clean up temp file
-                os.remove(temp_jpg)
-            
-            # Save the final PDF
-            doc.save(self.output_pdf)
-            doc.close()
+                # Save the final PDF
+                doc.save(self.output_pdf)
+            finally:
+                doc.close()
             
             print(f"✅ Spread PDF created: {self.output_pdf}")
             return True
             
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"❌ Error creating PDF: {e}")
             return False
@@ -177,10 +241,22 @@ class PDFSpreadCreator:
     def cleanup(self):
         """Clean up temporary files"""
         print("🧹 Cleaning up temporary files...")
-        
-        import shutil
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+        if self.raster_cache:
+            # This run is done with its pages; those of running jobs stay pinned
+            if self.raster_pin:
+                self.raster_cache.unpin(self.raster_pin)
+                self.raster_pin = None
+            self.raster_cache.evict()
+        print(self.scratch.summary())
+        self.scratch.cleanup()
+    
+    def record_rates(self, seconds):
+        """Add this run's per-page time to the job history used by cost estimates"""
+        try:
+            with fitz.open(self.input_pdf) as doc:
+                JobHistory().record_spreads(len(doc), self.dpi, seconds)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Warning: Could not record job rates: {e}")
     
     def run(self):
         """Main execution method"""
@@ -191,16 +267,19 @@ class PDFSpreadCreator:
         print(f"🔍 DPI: {self.dpi}")
         print()
         
+        started = time.monotonic()
         try:
             # Create spreads
-            final_pages = self.create_spreads()
+            with self.tracer.span('create_spreads'):
+                final_pages = self.create_spreads()
             
             if not final_pages:
                 print("❌ No pages to process!")
                 return False
             
             # Create final PDF using PyMuPDF
-            success = self.create_pdf_with_pymupdf(final_pages)
+            with self.tracer.span('create_pdf', pages=len(final_pages)):
+                success = self.create_pdf_with_pymupdf(final_pages)
             
             if success:
                 # Get file size
@@ -210,10 +289,17 @@ class PDFSpreadCreator:
                 print(f"📁 File size: {file_size / (1024*1024):.2f} MB")
                 print(f"📚 Total pages in spread PDF: {len(final_pages)}")
                 
+                # Cached renders would make the book look cheaper than it is
+                if not self.cached_pages:
+                    self.record_rates(time.monotonic() - started)
                 return True
             else:
                 return False
                 
+        except JobCancelled:
+            print("🛑 Spread creation cancelled, stopping")
+            return False
+            
         except Exception as e:
             print(f"❌ Error: {e}")
             return False
@@ -231,6 +317,10 @@ def main():
                         help="Page number to start spreads from (default: 2)")
     parser.add_argument("-d", "--dpi", type=int, default=300,
                         help="DPI for image extraction (default: 300)")
+    parser.add_argument("--no-raster-cache", action="store_true",
+                        help="Render every page again instead of reusing pages rendered by earlier runs")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the run and save reports next to the output PDF")
     
     args = parser.parse_args()
     
@@ -244,11 +334,21 @@ def main():
         input_pdf=args.input_pdf,
         output_pdf=args.output,
         start_spread_page=args.start_page,
-        dpi=args.dpi
+        dpi=args.dpi,
+        raster_cache=not args.no_raster_cache
     )
     
     # Run the conversion
-    success = creator.run()
+    if args.profile:
+        from profiling import JobProfiler, profile_output_base
+        
+        with JobProfiler() as profiler:
+            success = creator.run()
+        
+        for path in profiler.save(profile_output_base(creator.output_pdf)):
+            print(f"📈 Profile written: {path}")
+    else:
+        success = creator.run()
     
     if success:
         print("\n🎉 PDF spread creation completed successfully!")
@@ -13,16 +13,16 @@ from tqdm import tqdm
 import sys
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 
+from http_client import create_session
+
 
 class PhotoBookFetcher:
     def __init__(self, base_url, start_page=1, end_page=98):
         self.base_url = base_url
         self.start_page = start_page
         self.end_page = end_page
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        # Per-job session (own cookies) on top of the process-wide connection pool
+        self.session = create_session()
         
         # Create directories
         self.images_dir = "images"
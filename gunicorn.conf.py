@@ -14,16 +14,23 @@ worker_connections = 1000
 timeout = 300
 keepalive = 2
 
-# Gevent-specific configuration for WebSocket support
-def when_ready(server):
-    """Configure gevent-websocket when server is ready"""
-    from gevent import monkey
-    monkey.patch_all()
-
-def post_fork(server, worker):
-    """Configure worker after fork"""
-    from gevent import monkey
-    monkey.patch_all()
+# Gevent monkey patching happens once, at the top of web_interface.py (imported
+# by the master because of preload_app); the gevent worker class re-applies it.
+
+# Seconds after a worker starts serving before heavy job modules are imported
+prewarm_delay = float(os.environ.get('PREWARM_DELAY', '1.0'))
+
+def post_worker_init(worker):
+    """Start the loop monitor and prewarm heavy job imports once the worker is serving"""
+    # Threads don't survive the fork, so the monitor starts here, not at import
+    from loop_monitor import loop_monitor
+    loop_monitor.start()
+    
+    if prewarm_delay < 0:
+        return
+    import gevent
+    from web_interface import prewarm_imports
+    gevent.spawn_later(prewarm_delay, prewarm_imports)
 
 # Restart workers after this many requests, to help prevent memory leaks
 max_requests = 1000
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client layer
+One process-wide connection pool reused by every fetch job, so concurrent
+and consecutive jobs against the CEWE host skip TCP and TLS handshakes
+"""
+
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# Number of distinct hosts whose pools are kept alive
+POOL_HOSTS = int(os.environ.get('CEWE_HTTP_POOL_HOSTS', '10'))
+# Maximum open connections per host
+POOL_MAXSIZE = int(os.environ.get('CEWE_HTTP_POOL_MAXSIZE', '10'))
+# Wait for a free connection instead of opening more than POOL_MAXSIZE per host
+POOL_BLOCK = os.environ.get('CEWE_HTTP_POOL_BLOCK', '1') != '0'
+# Seconds to cache DNS lookups (0 disables the cache)
+DNS_CACHE_TTL = float(os.environ.get('CEWE_DNS_CACHE_TTL', '300'))
+# Most lookups kept; the least recently used go first
+DNS_CACHE_SIZE = int(os.environ.get('CEWE_DNS_CACHE_SIZE', '256'))
+
+_lock = threading.Lock()
+_adapter = None
+
+_dns_cache = OrderedDict()
+_dns_lock = threading.Lock()
+_dns_stats = {'hits': 0, 'misses': 0}
+_original_getaddrinfo = None
+
+
+def _cached_getaddrinfo(*args, **kwargs):
+    """socket.getaddrinfo with a small TTL and LRU cache in front of it"""
+    key = (args, tuple(sorted(kwargs.items())))
+    now = time.monotonic()
+    with _dns_lock:
+        cached = _dns_cache.get(key)
+        if cached and cached[0] > now:
+            _dns_cache.move_to_end(key)
+            _dns_stats['hits'] += 1
+            return cached[1]
+        _dns_stats['misses'] += 1
+
+    result = _original_getaddrinfo(*args, **kwargs)
+    with _dns_lock:
+        # Drop expired lookups, then the least recently used beyond the cap
+        for expired in [k for k, (expires, _) in _dns_cache.items() if expires <= now]:
+            del _dns_cache[expired]
+        _dns_cache[key] = (now + DNS_CACHE_TTL, result)
+        while len(_dns_cache) > DNS_CACHE_SIZE:
+            _dns_cache.popitem(last=False)
+    return result
+
+
+def install_dns_cache():
+    """Route socket.getaddrinfo through the DNS cache (idempotent)"""
+    global _original_getaddrinfo
+    with _lock:
+        if DNS_CACHE_TTL <= 0 or _original_getaddrinfo is not None:
+            return
+        _original_getaddrinfo = socket.getaddrinfo
+        socket.getaddrinfo = _cached_getaddrinfo
+
+
+def get_adapter():
+    """Return the process-wide pooled adapter, creating it on first use"""
+    global _adapter
+    with _lock:
+        if _adapter is None:
+            _adapter = HTTPAdapter(
+                pool_connections=POOL_HOSTS,
+                pool_maxsize=POOL_MAXSIZE,
+                pool_block=POOL_BLOCK
+            )
+    install_dns_cache()
+    return _adapter
+
+
+class SharedPoolSession(requests.Session):
+    """Session with its own headers and cookies but the shared connection pool"""
+
+    def __init__(self):
+        super().__init__()
+        adapter = get_adapter()
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.headers.update({'User-Agent': USER_AGENT})
+
+    def close(self):
+        """Connections belong to the shared pool, so there is nothing to release"""
+
+
+def create_session():
+    """Create a session for one job, backed by the shared connection pool"""
+    return SharedPoolSession()
+
+
+def get_pool_stats():
+    """Return connection pool and DNS cache statistics"""
+    adapter = get_adapter()
+    pools = []
+    manager = adapter.poolmanager
+
+    for key in manager.pools.keys():
+        try:
+            pool = manager.pools[key]
+        except KeyError:
+            # Evicted between listing and lookup
+            continue
+        requests_served = pool.num_requests
+        connections_opened = pool.num_connections
+        pools.append({
+            'scheme': key.key_scheme,
+            'host': key.key_host,
+            'port': key.key_port,
+            'maxsize': pool.pool.maxsize if pool.pool else 0,
+            'idle_connections': pool.pool.qsize() if pool.pool else 0,
+            'connections_opened': connections_opened,
+            'requests': requests_served,
+            'reuse_ratio': (round(1 - connections_opened / requests_served, 3)
+                            if requests_served else None),
+        })
+
+    return {
+        'pool_hosts': POOL_HOSTS,
+        'pool_maxsize': POOL_MAXSIZE,
+        'pool_block': POOL_BLOCK,
+        'pools': pools,
+        'dns_cache': {
+            'enabled': _original_getaddrinfo is not None,
+            'ttl': DNS_CACHE_TTL,
+            'entries': len(_dns_cache),
+            'hits': _dns_stats['hits'],
+            'misses': _dns_stats['misses'],
+        },
+    }
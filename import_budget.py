@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check
+Measures how long each module takes to import in a fresh interpreter and
+fails if the web worker's startup path exceeds its budget
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+# Seconds allowed for a cold import; None means measured but not enforced
+BUDGETS = {
+    'web_interface': 0.5,
+    'admission': 0.05,
+    'artifacts': 0.05,
+    'cancellation': 0.05,
+    'cost_estimator': 0.05,
+    'loop_monitor': 0.05,
+    'memory_governor': 0.05,
+    'metrics': 0.05,
+    'tracing': 0.05,
+    'variants': 0.1,
+    'rate_governor': 0.05,
+    'page_cache': 0.1,
+    'profiling': 0.1,
+    'raster_cache': 0.05,
+    'scratch': 0.05,
+    'singleflight': 0.05,
+    'cewe_fetcher': None,
+    'create_spreads': None,
+}
+
+MEASURE = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def measure_import(module, runs=3):
+    """Best-of-N cold import time of a module in seconds"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", MEASURE.format(module=module)],
+            cwd=here, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        # Module-level prints (e.g. web_interface startup) come before the timing
+        elapsed = float(result.stdout.strip().splitlines()[-1])
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def slowest_imports(module, top=15):
+    """Self-time of the slowest imports pulled in by a module (python -X importtime)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=here, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check module import times against budgets")
+    parser.add_argument("modules", nargs="*", help="Modules to check (default: all with budgets)")
+    parser.add_argument("-r", "--runs", type=int, default=3,
+                        help="Runs per module, best is kept (default: 3)")
+    parser.add_argument("--explain", metavar="MODULE",
+                        help="Show the slowest imports pulled in by MODULE")
+
+    args = parser.parse_args()
+
+    if args.explain:
+        print(f"🔍 Slowest imports for {args.explain} (cumulative / self, ms):")
+        for cumulative, own, name in slowest_imports(args.explain):
+            print(f"   {cumulative / 1000:8.1f} {own / 1000:8.1f}  {name}")
+        return
+
+    over_budget = []
+    for module in args.modules or BUDGETS:
+        budget = BUDGETS.get(module)
+        try:
+            elapsed = measure_import(module, args.runs)
+        except RuntimeError as e:
+            print(f"⚠️  {module:20s} could not be imported: {e}")
+            continue
+
+        if budget is None:
+            status = "ℹ️ "
+        elif elapsed <= budget:
+            status = "✅"
+        else:
+            status = "❌"
+            over_budget.append(module)
+
+        budget_text = f"{budget * 1000:.0f} ms" if budget is not None else "-"
+        print(f"{status} {module:20s} {elapsed * 1000:8.1f} ms  (budget {budget_text})")
+
+    if over_budget:
+        print(f"\n❌ Over budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
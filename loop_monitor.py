@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Event-loop lag monitor for the gevent worker and the ASGI server
+Every request, WebSocket and (monkey-patched) job thread of a gevent worker
+shares one hub, so a CPU-heavy call that never yields freezes all of them.
+A ticker greenlet measures how late the hub wakes it up (loop lag), and
+gevent's monitoring thread reports every block longer than the threshold
+together with the stack of the code that held the loop. Under ASGI a ticker
+task does the same for the asyncio loop, and a watchdog thread takes the
+loop thread's stack when the ticker is overdue.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import warnings
+from collections import deque
+
+import metrics
+
+
+LOOP_LAG_THRESHOLD_MS = float(os.environ.get('CEWE_LOOP_LAG_THRESHOLD_MS', '100'))
+TICK_INTERVAL = 0.05  # seconds between ticker wake-ups
+LAG_SAMPLES = 2400    # about two minutes of ticks
+BLOCK_REPORTS = 20    # most recent blocking reports kept with their stacks
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(sorted_values, fraction):
+    """Value at fraction (0..1) of an already sorted list (nearest rank)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _blocked_stack(info):
+    """Stack lines of the blocked greenlet from a gevent EventLoopBlocked report"""
+    lines = []
+    for i, entry in enumerate(info):
+        if str(entry).startswith('Blocked Stack') and i + 1 < len(info):
+            lines = str(info[i + 1]).rstrip().splitlines()
+            break
+    return lines or [str(entry) for entry in info]
+
+
+class LoopMonitor:
+    def __init__(self, threshold_ms=LOOP_LAG_THRESHOLD_MS, interval=TICK_INTERVAL):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        # deque appends are atomic, so the monitoring thread can add reports
+        # without a lock (a patched lock must not be used from a real thread)
+        self.samples = deque(maxlen=LAG_SAMPLES)
+        self.blocks = deque(maxlen=BLOCK_REPORTS)
+        self.ticks = 0
+        self.slow_ticks = 0
+        self.max_lag = 0.0
+        self.started_at = None
+        self.reason = 'not started'
+        # Set while an asyncio loop is watched
+        self.loop_thread = None
+        self.last_tick = None
+
+    @property
+    def running(self):
+        return self.started_at is not None
+
+    def start(self):
+        """Start monitoring the current gevent hub; returns False where there is none
+
+        Call once per worker process, after forking: neither the ticker nor
+        the monitoring thread survive a fork.
+        """
+        if self.running:
+            return True
+        try:
+            import gevent
+            import gevent.events
+            from gevent import monkey
+        except ImportError:
+            self.reason = 'gevent is not installed'
+            return False
+        if not monkey.is_module_patched('threading'):
+            # Job threads are real threads then and cannot block request handling
+            self.reason = 'threading is not monkey-patched'
+            return False
+
+        gevent.config.monitor_thread = True
+        gevent.config.max_blocking_time = self.threshold
+        gevent.events.subscribers.append(self._on_event)
+        with warnings.catch_warnings():
+            # Memory monitoring needs psutil; only blocking is watched here
+            warnings.simplefilter('ignore')
+            gevent.get_hub().start_periodic_monitoring_thread()
+        # Only the worker's main hub is watched. Building a report touches
+        # patched threading from the monitoring thread, which creates a hub
+        # there; with the option left on, that hub would get a monitor too
+        # and report its own idle thread as blocked.
+        gevent.config.monitor_thread = False
+        gevent.spawn(self._tick)
+        self.started_at = time.time()
+        self.reason = None
+        logger.info(f"Loop monitor started (threshold {self.threshold * 1000:.0f} ms)")
+        return True
+
+    def start_asyncio(self):
+        """Start monitoring the running asyncio loop; call from a coroutine on it"""
+        import asyncio
+
+        if self.running:
+            return True
+        loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.last_tick = time.monotonic()
+        loop.create_task(self._tick_asyncio())
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+        self.started_at = time.time()
+        self.reason = None
+        logger.info(f"Loop monitor started for asyncio (threshold {self.threshold * 1000:.0f} ms)")
+        return True
+
+    def _record(self, lag):
+        self.samples.append(lag)
+        self.ticks += 1
+        self.max_lag = max(self.max_lag, lag)
+        metrics.LOOP_LAG_SECONDS.observe(lag)
+        if lag >= self.threshold:
+            self.slow_ticks += 1
+            metrics.LOOP_BLOCKS.inc()
+
+    def _tick(self):
+        import gevent
+
+        while True:
+            started = time.monotonic()
+            gevent.sleep(self.interval)
+            self._record(max(0.0, time.monotonic() - started - self.interval))
+
+    async def _tick_asyncio(self):
+        import asyncio
+
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.last_tick = time.monotonic()
+            self._record(max(0.0, self.last_tick - started - self.interval))
+
+    def _watch(self):
+        # Runs in its own thread: a blocked loop cannot report on itself
+        while True:
+            time.sleep(self.threshold)
+            if time.monotonic() - self.last_tick - self.interval < self.threshold:
+                continue
+            frame = sys._current_frames().get(self.loop_thread)
+            stack = traceback.format_stack(frame) if frame else []
+            self._report_block('asyncio loop', self.threshold, [line.rstrip() for line in stack])
+
+    def _on_event(self, event):
+        # Runs in gevent's monitoring thread, outside the hub
+        from gevent.events import EventLoopBlocked
+
+        if isinstance(event, EventLoopBlocked):
+            self._report_block(repr(event.greenlet), event.blocking_time, _blocked_stack(event.info))
+
+    def _report_block(self, greenlet, blocking_time, stack):
+        now = time.time()
+        # A long block is reported once per threshold interval; merge those
+        last = self.blocks[-1] if self.blocks else None
+        if last and last['greenlet'] == greenlet and now - last['last_seen'] < 2 * blocking_time:
+            last['reports'] += 1
+            last['last_seen'] = now
+            last['blocked_ms'] = round(last['reports'] * blocking_time * 1000, 1)
+            last['stack'] = stack
+            return
+        self.blocks.append({
+            'first_seen': now,
+            'last_seen': now,
+            'reports': 1,
+            # At least this long: one threshold interval per report
+            'blocked_ms': round(blocking_time * 1000, 1),
+            'greenlet': greenlet,
+            'stack': stack,
+        })
+
+    def stats(self, include_stacks=False):
+        """Lag percentiles in milliseconds and recent blocking reports"""
+        lags = sorted(self.samples)
+        blocks = list(self.blocks)
+        if not include_stacks:
+            blocks = [{key: value for key, value in block.items() if key != 'stack'} for block in blocks]
+        return {
+            'enabled': self.running,
+            'reason': self.reason,
+            'threshold_ms': self.threshold * 1000,
+            'ticks': self.ticks,
+            'slow_ticks': self.slow_ticks,
+            'lag_ms': {
+                'p50': round(percentile(lags, 0.50) * 1000, 2),
+                'p90': round(percentile(lags, 0.90) * 1000, 2),
+                'p99': round(percentile(lags, 0.99) * 1000, 2),
+                'max_recent': round(lags[-1] * 1000, 2) if lags else 0.0,
+                'max': round(self.max_lag * 1000, 2),
+            },
+            'samples': len(lags),
+            'blocks': blocks,
+        }
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Pixel-memory governor
+Decode, render and compose steps estimate their raw pixel memory from image
+dimensions before allocating and reserve it against a process-wide budget.
+Steps that do not fit wait for running ones to finish, so concurrent jobs
+cannot stack several huge bitmaps and get the process OOM-killed.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from cancellation import JobCancelled
+
+
+PIXEL_MEMORY_MB = int(os.environ.get('CEWE_PIXEL_MEMORY_MB', '768'))
+WAIT_POLL_INTERVAL = 0.5  # seconds between cancellation checks while waiting
+
+# Bytes per pixel of Pillow's in-memory modes (1-bit images use a byte per pixel)
+MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'LA': 2, 'I;16': 2, 'RGB': 3, 'YCbCr': 3, 'LAB': 3, 'HSV': 3,
+              'RGBA': 4, 'RGBX': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+
+
+def pixel_bytes(width, height, mode='RGB'):
+    """Raw memory of a width x height bitmap in the given Pillow mode"""
+    return int(width) * int(height) * MODE_BYTES.get(mode, 4)
+
+
+class MemoryGovernor:
+    def __init__(self, budget_mb=PIXEL_MEMORY_MB):
+        self.budget = budget_mb * 1024 * 1024
+        self.condition = threading.Condition()
+        self.in_use = 0
+        self.active = 0
+        self.peak = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.oversized = 0
+
+    def _fits(self, nbytes):
+        # An idle governor admits anything, so a single oversized step still runs
+        return self.active == 0 or self.in_use + nbytes <= self.budget
+
+    @contextmanager
+    def reserve(self, nbytes, cancel_token=None):
+        """Hold nbytes of the budget for the duration of the with block
+
+        Blocks until the reservation fits; raises JobCancelled if cancel_token
+        is cancelled while waiting.
+        """
+        nbytes = max(0, int(nbytes))
+        with self.condition:
+            if nbytes > self.budget:
+                self.oversized += 1
+            if not self._fits(nbytes):
+                self.waits += 1
+                started = time.monotonic()
+                try:
+                    while not self._fits(nbytes):
+                        if cancel_token is not None and cancel_token.cancelled:
+                            raise JobCancelled()
+                        self.condition.wait(WAIT_POLL_INTERVAL)
+                finally:
+                    waited = time.monotonic() - started
+                    self.wait_seconds += waited
+                    metrics.PIXEL_MEMORY_WAIT_SECONDS.inc(waited)
+            self.in_use += nbytes
+            self.active += 1
+            self.peak = max(self.peak, self.in_use)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_use -= nbytes
+                self.active -= 1
+                self.condition.notify_all()
+
+    def stats(self):
+        """Budget, current and peak reservations, and time spent waiting"""
+        with self.condition:
+            return {
+                'budget_bytes': self.budget,
+                'in_use_bytes': self.in_use,
+                'active': self.active,
+                'peak_bytes': self.peak,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 3),
+                'oversized': self.oversized,
+            }
+
+
+_governor = MemoryGovernor()
+
+
+def get_governor():
+    """The process-wide pixel-memory governor"""
+    return _governor
+
+
+def reserve_pixels(nbytes, cancel_token=None):
+    """Reserve nbytes against the process-wide budget (a context manager)"""
+    return _governor.reserve(nbytes, cancel_token)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Lightweight Prometheus-style metrics
+Counters, gauges and histograms rendered in the Prometheus text exposition
+format, without pulling in an extra dependency
+"""
+
+import threading
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (16e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6)
+JOB_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+        self.function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Compute the gauge at scrape time; function returns {label tuple: value}"""
+        self.function = function
+
+    def _samples(self):
+        if self.function is not None:
+            items = sorted(self.function().items())
+        else:
+            with self.lock:
+                items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self.values[key] = (counts, total + value)
+
+    def _samples(self):
+        with self.lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_all():
+    """Render every registered metric in Prometheus text format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# Pipeline metrics shared by the fetcher, the spread creator and the web interface
+PAGE_FETCH_SECONDS = Histogram(
+    "cewe_page_fetch_seconds", "Time to download and validate one page image")
+PAGE_FETCH_BYTES = Histogram(
+    "cewe_page_fetch_bytes", "Size of downloaded page images in bytes", buckets=BYTES_BUCKETS)
+HTTP_RESPONSES = Counter(
+    "cewe_http_responses_total", "HTTP responses received from CEWE by status code",
+    ["method", "status"])
+HTTP_RETRIES = Counter(
+    "cewe_http_retries_total", "Retried HTTP requests by reason", ["reason"])
+PDF_PAGE_SECONDS = Histogram(
+    "cewe_pdf_page_seconds", "Time to add one page to a PDF", ["builder"])
+SPREAD_PAGE_SECONDS = Histogram(
+    "cewe_spread_page_seconds", "Spread creator time per page by stage", ["stage"])
+JOB_DURATION_SECONDS = Histogram(
+    "cewe_job_duration_seconds", "Job duration by job type and outcome", ["type", "outcome"],
+    buckets=JOB_BUCKETS)
+JOBS_RUNNING = Gauge(
+    "cewe_jobs_running", "Jobs currently running by type", ["type"])
+JOBS_QUEUED = Gauge(
+    "cewe_jobs_queued", "Jobs waiting to start")
+ADMISSION_REJECTIONS = Counter(
+    "cewe_admission_rejections_total", "Jobs turned away by admission control by reason", ["reason"])
+SCRATCH_BYTES = Gauge(
+    "cewe_scratch_bytes", "Bytes used by scratch directories", ["directory"])
+JOB_SCRATCH_BYTES = Gauge(
+    "cewe_job_scratch_bytes", "Bytes held in per-job scratch space by storage tier", ["tier"])
+PIXEL_MEMORY_BYTES = Gauge(
+    "cewe_pixel_memory_bytes", "Pixel memory reserved with the memory governor: budget, in use and peak",
+    ["state"])
+PIXEL_MEMORY_WAIT_SECONDS = Counter(
+    "cewe_pixel_memory_wait_seconds_total", "Time image operations waited for pixel memory")
+LOOP_LAG_SECONDS = Histogram(
+    "cewe_loop_lag_seconds", "How late the gevent hub ran the loop monitor's ticker")
+LOOP_BLOCKS = Counter(
+    "cewe_loop_blocks_total", "Ticks delayed beyond the loop lag threshold")
+CACHE_HIT_RATIO = Gauge(
+    "cewe_cache_hit_ratio", "Hit ratio of in-process caches", ["cache"])
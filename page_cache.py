@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Page cache with perceptual fingerprints
+Keeps the full-resolution pages of a book together with a fingerprint of a
+tiny render of each page, so a refresh only has to download the tiny
+renders and can re-fetch just the pages whose fingerprint changed. Normal
+fetches fill the cache too, so the first refresh already has pages to keep
+"""
+
+import json
+import os
+import shutil
+
+from PIL import Image, ImageChops
+
+from artifacts import key_digest
+
+
+PAGE_CACHE_DIR = os.environ.get('CEWE_PAGE_CACHE_DIR', "page_cache")
+FINGERPRINT_WIDTH = 64  # width of the tiny render requested from the server
+FINGERPRINT_SIZE = 16   # fingerprint grid; FINGERPRINT_SIZE ** 2 bits
+# Differing bits tolerated before a page counts as changed
+FINGERPRINT_THRESHOLD = 4
+
+
+def fingerprint(image):
+    """Difference hash of an image as an int of FINGERPRINT_SIZE ** 2 bits
+
+    Each bit says whether a pixel of the downscaled grayscale image is
+    brighter than its right-hand neighbour. All steps run inside Pillow on
+    whole images (resize, subtract, threshold, bit packing), not per pixel
+    in Python.
+    """
+    size = FINGERPRINT_SIZE
+    small = image.convert('L').resize((size + 1, size), Image.Resampling.BOX)
+    left = small.crop((0, 0, size, size))
+    right = small.crop((1, 0, size + 1, size))
+    # subtract() clips at 0, so only pixels brighter than their neighbour stay non-zero
+    brighter = ImageChops.subtract(left, right).point(lambda v: 255 if v else 0)
+    bits = brighter.convert('1', dither=Image.Dither.NONE).tobytes()
+    return int.from_bytes(bits, 'big')
+
+
+def fingerprint_distance(a, b):
+    """Number of differing bits between two fingerprints"""
+    return bin(a ^ b).count('1')
+
+
+class PageCache:
+    """Full-resolution pages of one book at one width, with their fingerprints"""
+
+    def __init__(self, order_id, book_hash, width, root=PAGE_CACHE_DIR):
+        key = {'order_id': str(order_id), 'hash': str(book_hash), 'width': int(width)}
+        self.directory = os.path.join(root, key_digest(key)[:16])
+        self.index_path = os.path.join(self.directory, "index.json")
+        try:
+            with open(self.index_path) as f:
+                self.pages = json.load(f)['pages']
+        except (OSError, ValueError, KeyError):
+            self.pages = {}
+
+    def get(self, page_number):
+        """(path, fingerprint) of a cached page, or None"""
+        entry = self.pages.get(str(page_number))
+        if not entry:
+            return None
+        path = os.path.join(self.directory, entry['file'])
+        if not os.path.exists(path):
+            return None
+        return path, int(entry['fingerprint'], 16)
+
+    def put(self, page_number, image_path, page_fingerprint):
+        """Store a copy of a full-resolution page and return the cached path"""
+        os.makedirs(self.directory, exist_ok=True)
+        filename = f"page_{page_number:03d}{os.path.splitext(image_path)[1] or '.jpg'}"
+        path = os.path.join(self.directory, filename)
+        shutil.copyfile(image_path, path)
+        self.pages[str(page_number)] = {
+            'file': filename,
+            'fingerprint': f"{page_fingerprint:x}",
+            'bytes': os.path.getsize(path),
+        }
+        return path
+
+    def save(self):
+        """Write the index atomically"""
+        os.makedirs(self.directory, exist_ok=True)
+        temp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp, 'w') as f:
+            json.dump({'pages': self.pages}, f, indent=2)
+        os.replace(temp, self.index_path)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Streaming PDF writer
+Writes JPEG pages into a PDF one at a time on any writable file-like object.
+JPEG data is embedded as-is (DCTDecode), and only the object offsets are
+kept in memory, so memory use does not grow with the number of pages.
+"""
+
+
+class StreamingPDFWriter:
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+        self.closed = False
+
+        # Binary comment marks the file as binary for transfer tools
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        # Track the position ourselves so non-seekable streams work
+        self.stream.write(data)
+        self.position += len(data)
+
+    def _allocate(self):
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def _write_object(self, object_id, body, stream_data=None):
+        self.offsets[object_id] = self.position
+        self._write(f"{object_id} 0 obj\n".encode('ascii'))
+        self._write(body.encode('ascii'))
+        if stream_data is not None:
+            self._write(b"\nstream\n")
+            self._write(stream_data)
+            self._write(b"\nendstream")
+        self._write(b"\nendobj\n")
+
+    def add_jpeg_page(self, jpeg_data, width, height, grayscale=False, dpi=72):
+        """Append a page showing one JPEG image at the given resolution"""
+        page_width = width * 72 / dpi
+        page_height = height * 72 / dpi
+        image_id, content_id, page_id = self._allocate(), self._allocate(), self._allocate()
+
+        color_space = "/DeviceGray" if grayscale else "/DeviceRGB"
+        self._write_object(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode "
+            f"/Length {len(jpeg_data)} >>"
+        ), jpeg_data)
+
+        content = f"q {page_width:.4f} 0 0 {page_height:.4f} 0 0 cm /Im0 Do Q".encode('ascii')
+        self._write_object(content_id, f"<< /Length {len(content)} >>", content)
+
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent {self.PAGES_ID} 0 R "
+            f"/MediaBox [0 0 {page_width:.4f} {page_height:.4f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>"
+        ))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        """Write the page tree, cross-reference table and trailer"""
+        if self.closed:
+            return
+        self.closed = True
+
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._write_object(self.PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self._write_object(self.CATALOG_ID, f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>")
+
+        xref_position = self.position
+        size = self.next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for object_id in range(1, size):
+            lines.append(f"{self.offsets[object_id]:010d} 00000 n \n")
+        self._write("".join(lines).encode('ascii'))
+        self._write((
+            f"trailer\n<< /Size {size} /Root {self.CATALOG_ID} 0 R >>\n"
+            f"startxref\n{xref_position}\n%%EOF\n"
+        ).encode('ascii'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        return False
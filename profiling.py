@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Job profiling
+Runs a job under cProfile, a stack sampler and tracemalloc, and writes a
+hot-function report, a flamegraph-compatible folded-stack dump and the
+allocation sites at peak memory next to the job's output
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+# cProfile can only be enabled once per process (Python 3.12+ rejects a second
+# profiler), so profiled jobs take turns
+_profile_lock = threading.Lock()
+
+
+def _real_thread_api():
+    """Return (get_ident, start_new_thread) that bypass gevent monkey-patching
+
+    The sampler must be a real OS thread so it keeps running while the job
+    hogs the CPU, and it must identify the job by its OS thread id.
+    """
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            return (monkey.get_original('_thread', 'get_ident'),
+                    monkey.get_original('_thread', 'start_new_thread'))
+    except ImportError:
+        pass
+    import _thread
+    return _thread.get_ident, _thread.start_new_thread
+
+
+def profiler_busy():
+    """Whether a job is being profiled right now"""
+    return _profile_lock.locked()
+
+
+class JobProfiler:
+    """Context manager profiling everything the current thread does
+
+    Only one JobProfiler runs at a time; entering waits for the running one.
+    """
+
+    def __init__(self, sample_interval=SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self.profile = cProfile.Profile()
+        self.stacks = Counter()
+        self.peak_snapshot = None
+        self.peak_bytes = 0
+        self.wall_time = 0.0
+        self._running = False
+        self._sampler_done = threading.Event()
+
+    def __enter__(self):
+        global _tracemalloc_users
+        _profile_lock.acquire()
+        with _tracemalloc_lock:
+            if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+            _tracemalloc_users += 1
+
+        get_ident, start_new_thread = _real_thread_api()
+        self._target = get_ident()
+        self._running = True
+        start_new_thread(self._sample, ())
+
+        self._started = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _tracemalloc_users
+        self.profile.disable()
+        self.wall_time = time.perf_counter() - self._started
+
+        self._running = False
+        self._sampler_done.wait(1)
+
+        _, peak = tracemalloc.get_traced_memory()
+        self.peak_bytes = max(self.peak_bytes, peak)
+        if self.peak_snapshot is None:
+            self.peak_snapshot = tracemalloc.take_snapshot()
+
+        with _tracemalloc_lock:
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0:
+                tracemalloc.stop()
+        _profile_lock.release()
+        return False
+
+    def _sample(self):
+        """Sample the job's stack and snapshot allocations at each new memory peak"""
+        snapshot_at = 0
+        try:
+            while self._running:
+                frame = sys._current_frames().get(self._target)
+                if frame is not None:
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    self.stacks[";".join(reversed(stack))] += 1
+
+                current, _ = tracemalloc.get_traced_memory()
+                # Re-snapshot only when memory grew noticeably past the last peak
+                if current > snapshot_at * 1.1 and current > 1024 * 1024:
+                    self.peak_snapshot = tracemalloc.take_snapshot()
+                    self.peak_bytes = max(self.peak_bytes, current)
+                    snapshot_at = current
+
+                time.sleep(self.sample_interval)
+        finally:
+            self._sampler_done.set()
+
+    def save(self, base_path):
+        """Write report files next to base_path and return their paths"""
+        report_path = f"{base_path}.profile.txt"
+        folded_path = f"{base_path}.folded.txt"
+        memory_path = f"{base_path}.memory.txt"
+
+        buffer = io.StringIO()
+        buffer.write(f"Wall time: {self.wall_time:.2f}s\n\n")
+        stats = pstats.Stats(self.profile, stream=buffer)
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        stats.sort_stats('tottime').print_stats(TOP_FUNCTIONS)
+        with open(report_path, 'w') as f:
+            f.write(buffer.getvalue())
+
+        # Folded stacks: feed to flamegraph.pl or speedscope
+        with open(folded_path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(memory_path, 'w') as f:
+            f.write(f"Peak traced memory: {self.peak_bytes / (1024 * 1024):.1f} MB\n\n")
+            if self.peak_snapshot is not None:
+                f.write(f"Top {TOP_ALLOCATIONS} allocation sites at peak:\n")
+                for stat in self.peak_snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+
+        return [report_path, folded_path, memory_path]
+
+
+def profile_output_base(output_pdf):
+    """Base path for profile files saved next to an output PDF"""
+    return os.path.splitext(output_pdf)[0]
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Rendered-page raster cache
+Keeps pages rendered by the spread creator, keyed by the input PDF's content
+hash, page index and DPI, so re-pairing the same book with another start
+page skips rendering. The cache is capped in size; the least recently used
+pages are evicted first (file mtime is the use time). Running jobs pin the
+pages they use, in any process, and pinned pages are never evicted.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+
+RASTER_CACHE_DIR = os.environ.get('CEWE_RASTER_CACHE_DIR', "raster_cache")
+RASTER_CACHE_MB = int(os.environ.get('CEWE_RASTER_CACHE_MB', '1024'))
+PINS_DIR = ".pins"  # one file per running job, naming the pages it uses
+
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def get_stats():
+    """Process-wide hit, miss and eviction counts"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """sha256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class RasterCache:
+    def __init__(self, root=RASTER_CACHE_DIR, max_mb=RASTER_CACHE_MB):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def directory(self, pdf_digest, dpi):
+        """Directory holding the renders of one PDF at one DPI"""
+        return os.path.join(self.root, pdf_digest[:32], f"{dpi}dpi")
+
+    def path(self, pdf_digest, page_index, dpi):
+        """Where the render of one page lives (whether or not it exists yet)"""
+        return os.path.join(self.directory(pdf_digest, dpi), f"page_{page_index + 1:04d}.png")
+
+    def pin(self, pdf_digest, dpi):
+        """Protect the pages of one PDF at one DPI from eviction until unpin()
+
+        The pin is a file, so runs in other processes respect it too. Pins
+        of processes that have died are dropped by the next eviction.
+        Returns the pin to pass to unpin().
+        """
+        pins = os.path.join(self.root, PINS_DIR)
+        os.makedirs(pins, exist_ok=True)
+        pin = os.path.join(pins, f"{os.getpid()}_{uuid.uuid4().hex}")
+        with open(pin, 'w') as f:
+            f.write(os.path.relpath(self.directory(pdf_digest, dpi), self.root))
+        return pin
+
+    def unpin(self, pin):
+        """Release a pin returned by pin()"""
+        try:
+            os.remove(pin)
+        except OSError:
+            pass
+
+    def pinned(self):
+        """Directories pinned by running jobs"""
+        pins = os.path.join(self.root, PINS_DIR)
+        try:
+            names = os.listdir(pins)
+        except OSError:
+            return set()
+        directories = set()
+        for name in names:
+            pin = os.path.join(pins, name)
+            pid = name.partition('_')[0]
+            if pid.isdigit() and not _process_alive(int(pid)):
+                self.unpin(pin)
+                continue
+            try:
+                with open(pin) as f:
+                    directories.add(os.path.join(self.root, f.read().strip()))
+            except OSError:
+                continue
+        return directories
+
+    def get(self, pdf_digest, page_index, dpi):
+        """Path of a cached render, or None; a hit marks the page as recently used"""
+        path = self.path(pdf_digest, page_index, dpi)
+        try:
+            os.utime(path)
+        except OSError:
+            _count('misses')
+            return None
+        _count('hits')
+        return path
+
+    def put(self, pdf_digest, page_index, dpi, write):
+        """Render into the cache with write(temp_path) and return the cached path
+
+        The file only appears under its final name once complete, so a
+        concurrent or interrupted run never sees a partial render.
+        """
+        path = self.path(pdf_digest, page_index, dpi)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.png"
+        try:
+            write(temp)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return path
+
+    def entries(self):
+        """(mtime, size, path) of every cached page"""
+        found = []
+        for directory, subdirectories, files in os.walk(self.root):
+            if PINS_DIR in subdirectories:
+                subdirectories.remove(PINS_DIR)
+            for name in files:
+                if name.endswith('.tmp.png'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, path))
+        return found
+
+    def evict(self):
+        """Delete least recently used pages until the cache fits its size cap
+
+        Pages pinned by running jobs are never evicted, so the cache only
+        stays over its cap while pinned pages alone exceed it.
+        Returns the number of bytes freed.
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        pinned = self.pinned()
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= self.max_bytes:
+                break
+            if os.path.dirname(path) in pinned:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            freed += size
+            _count('evictions')
+        # Drop directories of books that no longer have any pages
+        for directory, _, _ in sorted(os.walk(self.root), reverse=True):
+            if directory != self.root:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+        return freed
+
+    def usage(self):
+        """Size and age summary of the cache"""
+        entries = self.entries()
+        return {
+            'pages': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'oldest_use_seconds': round(time.time() - min(mtime for mtime, _, _ in entries), 1) if entries else None,
+        }
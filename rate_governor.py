@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Adaptive politeness governor
+A per-host token bucket shared by every job in the process. The rate grows
+slowly while the server answers quickly and is cut back on slow responses,
+429/503 replies and Retry-After headers.
+"""
+
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from cancellation import JobCancelled
+
+
+INITIAL_RATE = float(os.environ.get('CEWE_RATE_INITIAL', '8'))      # requests/second
+MIN_RATE = float(os.environ.get('CEWE_RATE_MIN', '0.5'))
+MAX_RATE = float(os.environ.get('CEWE_RATE_MAX', '25'))
+TARGET_LATENCY = float(os.environ.get('CEWE_RATE_TARGET_LATENCY', '1.5'))  # seconds to headers
+
+THROTTLE_STATUSES = (429, 503)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Exponential backoff with full jitter for the given retry attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class AdaptiveRateGovernor:
+    def __init__(self, initial_rate=INITIAL_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE,
+                 target_latency=TARGET_LATENCY):
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        # Allow a short burst of about one second's worth of requests
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+        self.stats = {'requests': 0, 'throttled': 0, 'slow': 0, 'errors': 0}
+
+    def _refill(self, now):
+        """Add tokens for the time elapsed since the last refill"""
+        capacity = max(1.0, self.rate)
+        self.tokens = min(capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, cancel_token=None):
+        """Block until the next request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+
+            if cancel_token is not None:
+                if cancel_token.wait(wait):
+                    raise JobCancelled()
+            else:
+                time.sleep(wait)
+
+    def record(self, latency, status_code, retry_after=None):
+        """Adjust the rate from an observed response"""
+        with self.lock:
+            self.stats['requests'] += 1
+            if status_code in THROTTLE_STATUSES:
+                # Multiplicative decrease and honour the server's pause request
+                self.stats['throttled'] += 1
+                self.rate = max(self.min_rate, self.rate * 0.5)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            elif status_code >= 500 or latency > self.target_latency:
+                self.stats['slow'] += 1
+                self.rate = max(self.min_rate, self.rate * 0.8)
+            else:
+                # Additive increase while the server is healthy
+                self.rate = min(self.max_rate, self.rate + 0.25)
+
+    def record_error(self):
+        """Back off after a connection error or timeout"""
+        with self.lock:
+            self.stats['errors'] += 1
+            self.rate = max(self.min_rate, self.rate * 0.5)
+
+    def get_stats(self):
+        """Return the current rate and counters"""
+        with self.lock:
+            return dict(self.stats,
+                        rate=round(self.rate, 2),
+                        blocked_for=round(max(0.0, self.blocked_until - time.monotonic()), 2))
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(url):
+    """Return the governor shared by every job talking to the URL's host"""
+    host = urlparse(url).netloc
+    with _governors_lock:
+        if host not in _governors:
+            _governors[host] = AdaptiveRateGovernor()
+        return _governors[host]
+
+
+def get_all_stats():
+    """Return statistics for every host seen so far"""
+    with _governors_lock:
+        governors = dict(_governors)
+    return {host: governor.get_stats() for host, governor in governors.items()}
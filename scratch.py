@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Per-job scratch storage
+Intermediate files (fetched pages, rendered PNGs, spreads) go to a fast
+RAM-backed directory such as /dev/shm while the job's quota and the device
+leave room, and spill over to disk otherwise. Usage is accounted per job.
+"""
+
+import os
+import shutil
+import threading
+import uuid
+import weakref
+
+
+# RAM-backed scratch root; unset keeps all scratch files on disk as before
+FAST_SCRATCH_DIR = os.environ.get('CEWE_SCRATCH_DIR')
+SCRATCH_QUOTA_MB = int(os.environ.get('CEWE_SCRATCH_QUOTA_MB', '256'))
+
+_active = weakref.WeakSet()
+_active_lock = threading.Lock()
+
+
+class JobScratch:
+    def __init__(self, name, disk_root, fast_root=FAST_SCRATCH_DIR, quota_mb=SCRATCH_QUOTA_MB, job_id=None):
+        self.name = name
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.disk_dir = os.path.join(disk_root, self.job_id)
+        self.fast_dir = os.path.join(fast_root, f"cewe-{self.job_id}") if fast_root else None
+        self.quota = quota_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.files = {}  # path -> size of files currently held
+        self.fast_bytes = 0
+        self.disk_bytes = 0
+        self.peak_fast_bytes = 0
+        self.written_files = 0
+        self.written_bytes = 0
+        self.spilled_files = 0
+        with _active_lock:
+            _active.add(self)
+
+    def _expected_size(self):
+        # New files are assumed to be about as large as the ones so far
+        return self.written_bytes // self.written_files if self.written_files else 0
+
+    def _fast_has_room(self, size):
+        if not self.fast_dir or self.fast_bytes + size > self.quota:
+            return False
+        try:
+            # Leave headroom so a tmpfs never fills up mid-write
+            return shutil.disk_usage(os.path.dirname(self.fast_dir)).free > size * 2
+        except OSError:
+            return False
+
+    def path(self, filename):
+        """Where to write a new file: the fast directory if it has room, else disk"""
+        with self.lock:
+            use_fast = self._fast_has_room(self._expected_size())
+            if self.fast_dir and not use_fast:
+                self.spilled_files += 1
+        directory = self.fast_dir if use_fast else self.disk_dir
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+    def record(self, path):
+        """Account a written file and return its final path
+
+        A file that pushed the fast directory over quota is moved to disk.
+        """
+        size = os.path.getsize(path)
+        fast = self.fast_dir is not None and os.path.dirname(path) == self.fast_dir
+        with self.lock:
+            if fast and self.fast_bytes + size > self.quota:
+                self.spilled_files += 1
+                fast = False
+                move_to = os.path.join(self.disk_dir, os.path.basename(path))
+            else:
+                move_to = None
+            self._forget(path)
+            self.files[move_to or path] = (size, fast)
+            if fast:
+                self.fast_bytes += size
+                self.peak_fast_bytes = max(self.peak_fast_bytes, self.fast_bytes)
+            else:
+                self.disk_bytes += size
+            self.written_files += 1
+            self.written_bytes += size
+
+        if move_to:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            shutil.move(path, move_to)
+            return move_to
+        return path
+
+    def _forget(self, path):
+        entry = self.files.pop(path, None)
+        if entry:
+            size, fast = entry
+            if fast:
+                self.fast_bytes -= size
+            else:
+                self.disk_bytes -= size
+
+    def remove(self, path):
+        """Delete a scratch file and release its space"""
+        with self.lock:
+            self._forget(path)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def usage(self):
+        """Current and cumulative usage of this job's scratch space"""
+        with self.lock:
+            return {
+                'job': self.name,
+                'job_id': self.job_id,
+                'fast_dir': self.fast_dir,
+                'disk_dir': self.disk_dir,
+                'quota_bytes': self.quota if self.fast_dir else 0,
+                'fast_bytes': self.fast_bytes,
+                'disk_bytes': self.disk_bytes,
+                'peak_fast_bytes': self.peak_fast_bytes,
+                'written_files': self.written_files,
+                'written_bytes': self.written_bytes,
+                'spilled_files': self.spilled_files,
+            }
+
+    def summary(self):
+        """One-line usage report for job output"""
+        usage = self.usage()
+        mb = 1024 * 1024
+        if not self.fast_dir:
+            return f"💾 Scratch: {usage['written_bytes'] / mb:.1f} MB written to disk"
+        return (f"💾 Scratch: {usage['written_bytes'] / mb:.1f} MB written, "
+                f"peak {usage['peak_fast_bytes'] / mb:.1f} MB in RAM, "
+                f"{usage['spilled_files']} files spilled to disk")
+
+    def cleanup(self):
+        """Delete all of this job's scratch files"""
+        with self.lock:
+            self.files.clear()
+            self.fast_bytes = 0
+            self.disk_bytes = 0
+        for directory in (self.fast_dir, self.disk_dir):
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+        with _active_lock:
+            _active.discard(self)
+
+
+def get_all_usage():
+    """Usage of every job scratch area that has not been cleaned up"""
+    with _active_lock:
+        jobs = list(_active)
+    return [job.usage() for job in jobs]
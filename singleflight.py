@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Single-flight call deduplication
+Concurrent calls with the same key share one execution: the first caller
+runs the function and everyone else waits for its result
+"""
+
+import threading
+
+from cancellation import JobCancelled
+
+
+WAIT_POLL_INTERVAL = 0.5  # seconds between cancellation checks while waiting
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def do(self, key, function, cancel_token=None):
+        """Run function once per key at a time; returns (result, shared)
+
+        shared is True when the result came from another caller's execution.
+        Exceptions are re-raised in every waiting caller, except when the
+        running caller was cancelled: waiters then retry with one of them
+        taking over. A waiter's own cancel_token is honoured while waiting.
+        """
+        while True:
+            with self.lock:
+                flight = self.flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self.flights[key] = _Flight()
+                else:
+                    flight.waiters += 1
+
+            if leader:
+                try:
+                    flight.result = function()
+                    return flight.result, False
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    with self.lock:
+                        del self.flights[key]
+                    flight.done.set()
+
+            while not flight.done.wait(WAIT_POLL_INTERVAL):
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+
+            if isinstance(flight.error, JobCancelled):
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+    def in_flight(self):
+        """Keys currently being executed and how many callers wait on each"""
+        with self.lock:
+            return {key: flight.waiters for key, flight in self.flights.items()}
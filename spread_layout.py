@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Spread layout
+Which pages of a book form a spread and how two pages are placed side by
+side, shared by the spread creator and the spread variants of a fetch
+"""
+
+from PIL import Image
+
+
+SPREAD_START_PAGE = 2  # the cover stays a single page
+
+
+def spread_groups(page_count, start_spread_page=SPREAD_START_PAGE):
+    """Page indexes per output page: singles before start_spread_page, then pairs
+
+    An odd page left at the end stays a single page.
+    """
+    singles = min(max(start_spread_page - 1, 0), page_count)
+    groups = [(i,) for i in range(singles)]
+    for i in range(singles, page_count, 2):
+        groups.append((i, i + 1) if i + 1 < page_count else (i,))
+    return groups
+
+
+def compose_spread(images):
+    """Place images side by side at the height of the tallest one"""
+    height = max(img.height for img in images)
+    images = [img if img.height == height else
+              img.resize((int(img.width * height / img.height), height), Image.Resampling.LANCZOS)
+              for img in images]
+    spread = Image.new('RGB', (sum(img.width for img in images), height), 'white')
+    x = 0
+    for img in images:
+        spread.paste(img, (x, 0))
+        x += img.width
+    return spread
@@ -34,6 +34,11 @@ if [ "${FLASK_ENV:-}" = "production" ]; then
     echo "🌐 Web interface will be available on port 4200"
     echo "🔧 Press Ctrl+C to stop the server"
     
+    if [ "${CEWE_SERVER_MODE:-gevent}" = "asgi" ]; then
+        # asyncio server without gevent monkey-patching
+        exec uvicorn asgi_app:application --host 0.0.0.0 --port 4200 --workers 1
+    fi
+    
     # Start with Gunicorn for production
     exec gunicorn --config gunicorn.conf.py web_interface:application
 else
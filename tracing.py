@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Per-job tracing
+Records a tree of timed spans for one job and exports it in the Chrome
+trace-event format (chrome://tracing, Perfetto, speedscope)
+"""
+
+import os
+import threading
+import time
+
+
+class Span:
+    def __init__(self, tracer, name, parent, args):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.args = args
+        self.depth = parent.depth + 1 if parent else 0
+        self.thread_id = threading.get_ident()
+        self.start = None
+        self.end = None
+
+    def set(self, **args):
+        """Attach extra data to the span (e.g. bytes=...)"""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer._pop(self)
+        return False
+
+
+class _NullSpan:
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class NullTracer:
+    """Tracer that records nothing; used when a job is not traced"""
+
+    _span = _NullSpan()
+
+    def span(self, name, **args):
+        return self._span
+
+
+NULL_TRACER = NullTracer()
+
+
+class Tracer:
+    def __init__(self, name="job"):
+        self.name = name
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def span(self, name, **args):
+        """Context manager recording one span, nested under the current one"""
+        stack = getattr(self.local, 'stack', None)
+        parent = stack[-1] if stack else None
+        return Span(self, name, parent, dict(args))
+
+    def _push(self, span):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        self.local.stack.append(span)
+
+    def _pop(self, span):
+        stack = self.local.stack
+        if stack and stack[-1] is span:
+            stack.pop()
+        with self.lock:
+            self.spans.append(span)
+
+    def _finished_spans(self):
+        with self.lock:
+            return sorted((s for s in self.spans if s.end is not None), key=lambda s: s.start)
+
+    def to_chrome_trace(self):
+        """Export as Chrome trace-event JSON (complete 'X' events, microseconds)"""
+        pid = os.getpid()
+        events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': pid,
+            'args': {'name': self.name}
+        }]
+        for span in self._finished_spans():
+            events.append({
+                'name': span.name,
+                'cat': self.name,
+                'ph': 'X',
+                'ts': round((span.start - self.origin) * 1e6, 1),
+                'dur': round((span.end - span.start) * 1e6, 1),
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': span.args,
+            })
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'job': self.name, 'started_at': self.started_at},
+        }
+
+    def to_waterfall(self):
+        """Flat list of spans in start order, for rendering a waterfall"""
+        return [{
+            'name': span.name,
+            'start': round(span.start - self.origin, 4),
+            'duration': round(span.end - span.start, 4),
+            'depth': span.depth,
+            'args': span.args,
+        } for span in self._finished_spans()]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Output variants
+Builds several deliverables of one book (full or reduced width, single
+pages or spreads) from the same downloaded page images, each in a worker
+process, so a book is fetched once however many variants are requested
+"""
+
+import io
+import os
+
+from PIL import Image
+
+from memory_governor import pixel_bytes
+from pdf_stream import StreamingPDFWriter
+from spread_layout import SPREAD_START_PAGE, compose_spread, spread_groups
+
+
+VARIANT_LAYOUTS = ('pages', 'spreads')
+JPEG_QUALITY = 95
+
+
+def parse_variant(spec):
+    """Parse 'pages', 'spreads', '1080' or 'spreads@1080' into (layout, width or None)"""
+    layout, _, width = spec.partition('@')
+    if layout.isdigit() and not width:
+        layout, width = 'pages', layout
+    if layout not in VARIANT_LAYOUTS:
+        raise ValueError(f"unknown variant layout '{layout}' (expected one of {', '.join(VARIANT_LAYOUTS)})")
+    if width and not width.isdigit():
+        raise ValueError(f"invalid variant width '{width}'")
+    return layout, int(width) if width else None
+
+
+def variant_profile(layout, width, start_spread_page=SPREAD_START_PAGE):
+    """Artifact profile of a variant; full-width pages is the plain 'pdf' output"""
+    profile = 'pdf' if layout == 'pages' else f'pdf-spreads{start_spread_page}'
+    return f"{profile}-{width}w" if width else profile
+
+
+def variant_suffix(layout, width):
+    """File name suffix distinguishing a variant from the plain PDF"""
+    parts = ['spreads'] if layout == 'spreads' else []
+    if width:
+        parts.append(f"{width}w")
+    return "_".join(parts)
+
+
+def _scaled(img, width):
+    """img resized down to width (never up)"""
+    if not width or img.width <= width:
+        return img
+    height = max(1, round(img.height * width / img.width))
+    return img.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def _passes_through(images, width):
+    """Whether an output page is a single input JPEG that can be embedded as-is"""
+    first = images[0]
+    return len(images) == 1 and first.format == 'JPEG' and first.mode == 'RGB' and (not width or first.width <= width)
+
+
+def _layout_groups(page_count, layout, start_spread_page):
+    """Page indexes per output page of a layout"""
+    if layout == 'spreads':
+        return spread_groups(page_count, start_spread_page)
+    return [(i,) for i in range(page_count)]
+
+
+def peak_pixel_bytes(image_paths, layout, width=None, start_spread_page=SPREAD_START_PAGE):
+    """Largest pixel memory build_variant() needs for one output page
+
+    Only image headers are read. build_variant() runs in a worker process,
+    whose memory the parent's governor cannot see, so the parent reserves
+    this for the duration of the build.
+    """
+    peak = 0
+    for group in _layout_groups(len(image_paths), layout, start_spread_page):
+        opened = [Image.open(image_paths[i]) for i in group]
+        try:
+            if not _passes_through(opened, width):
+                # Decoded pages, their RGB and scaled copies, and the composed page
+                peak = max(peak, sum(3 * pixel_bytes(img.width, img.height) for img in opened))
+        finally:
+            for img in opened:
+                img.close()
+    return peak
+
+
+def _page_jpeg(paths, width):
+    """(JPEG bytes, width, height, dpi) of one output page made of one or two input pages"""
+    opened = [Image.open(path) for path in paths]
+    try:
+        first = opened[0]
+        dpi = first.info.get('dpi', (72, 72))[0] or 72
+        if _passes_through(opened, width):
+            # Nothing to change: embed the downloaded JPEG as-is
+            with open(paths[0], 'rb') as f:
+                return f.read(), first.width, first.height, dpi
+
+        pages = [_scaled(img.convert('RGB'), width) for img in opened]
+        page = pages[0] if len(pages) == 1 else compose_spread(pages)
+        buffer = io.BytesIO()
+        page.save(buffer, 'JPEG', quality=JPEG_QUALITY)
+        return buffer.getvalue(), page.width, page.height, dpi
+    finally:
+        for img in opened:
+            img.close()
+
+
+def build_variant(image_paths, output_path, layout, width=None, start_spread_page=SPREAD_START_PAGE):
+    """Write one variant PDF from page images in order (runs in a worker process)
+
+    width limits the width of each input page; spreads are two such pages
+    wide. The caller reserves peak_pixel_bytes() for it. Returns output_path.
+    """
+    groups = _layout_groups(len(image_paths), layout, start_spread_page)
+
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f, StreamingPDFWriter(f) as writer:
+            for group in groups:
+                data, page_width, page_height, dpi = _page_jpeg([image_paths[i] for i in group], width)
+                writer.add_jpeg_page(data, page_width, page_height, dpi=dpi)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
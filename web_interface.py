@@ -5,17 +5,28 @@ Provides a web UI to run the shell scripts and CEWE URL fetcher
 """
 
 import os
+import time
+
+_import_started = time.perf_counter()
+
+# 'gevent' (gunicorn, see gunicorn.conf.py) or 'asgi' (uvicorn, see asgi_app.py)
+SERVER_MODE = os.environ.get('CEWE_SERVER_MODE', 'gevent')
 
-# Early gevent monkey patching for production
-if os.environ.get('FLASK_ENV') == 'production':
+# Early gevent monkey patching for production. This is the only place it
+# happens: with preload_app the master imports this module before forking,
+# and the gevent worker class re-applies the (idempotent) patch itself.
+# The ASGI mode runs on asyncio with real threads and is never patched.
+if os.environ.get('FLASK_ENV') == 'production' and SERVER_MODE == 'gevent':
     from gevent import monkey
     monkey.patch_all()
 
+import importlib.util
 import subprocess
 import threading
-import time
-import glob
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for
+import hmac
+import shutil
+import uuid
+from flask import Flask, Response, render_template, request, jsonify, send_file, redirect, url_for
 from flask_socketio import SocketIO, emit
 import logging
 from datetime import datetime
@@ -24,40 +35,132 @@ import sys
 # Add current directory to path so we can import our scripts
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Try to import our CEWE fetcher
-try:
-    from cewe_fetcher import CEWEPhotoBookFetcher
-    CEWE_FETCHER_AVAILABLE = True
-except ImportError:
-    CEWE_FETCHER_AVAILABLE = False
+import metrics
+from admission import RETRY_AFTER, AdmissionController
+from archive_stream import ARCHIVE_FORMATS, iter_archive
+from cancellation import CancellationToken
+from loop_monitor import loop_monitor
+from memory_governor import get_governor as get_pixel_memory
+from profiling import JobProfiler, profile_output_base, profiler_busy
+from scratch import FAST_SCRATCH_DIR, JobScratch, get_all_usage as get_scratch_usage
+from tracing import Tracer
+from rate_governor import get_all_stats as get_rate_stats
+
+
+def _modules_available(*names):
+    """Check that modules are installed without importing them"""
+    return all(importlib.util.find_spec(name) is not None for name in names)
+
+
+# The fetcher (requests, PIL, bs4, tqdm) and the spreads creator (fitz, PIL)
+# are heavy to import, so they are only checked here and imported on first
+# use or by prewarm_imports() once the worker is serving.
+CEWE_FETCHER_AVAILABLE = _modules_available('requests', 'PIL', 'bs4', 'tqdm')
+if not CEWE_FETCHER_AVAILABLE:
     print("⚠️ CEWE fetcher not available. Install required dependencies.")
 
-# Try to import spreads creator
-try:
-    from create_spreads import PDFSpreadCreator
-    SPREADS_CREATOR_AVAILABLE = True
-except ImportError:
-    SPREADS_CREATOR_AVAILABLE = False
+SPREADS_CREATOR_AVAILABLE = _modules_available('fitz', 'PIL', 'tqdm')
+if not SPREADS_CREATOR_AVAILABLE:
     print("⚠️ Spreads creator not available.")
 
+
+def prewarm_imports():
+    """Import the heavy job modules ahead of the first job"""
+    started = time.perf_counter()
+    if CEWE_FETCHER_AVAILABLE:
+        import cewe_fetcher
+    if SPREADS_CREATOR_AVAILABLE:
+        import create_spreads
+    logger.info(f"Prewarmed job modules in {(time.perf_counter() - started) * 1000:.0f} ms")
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-this'
 
-# Configure SocketIO with proper gevent settings
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='gevent', 
+# Admin-only features (e.g. job profiling) are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Configure SocketIO with proper gevent settings. In ASGI mode asgi_app.py
+# serves Socket.IO itself and routes this object's emits to its server.
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='gevent' if SERVER_MODE == 'gevent' else 'threading',
                    logger=False, engineio_logger=False, 
                    ping_timeout=60, ping_interval=25)
 
+# Page previews are written per job so their URLs can be cached forever
+THUMBNAILS_DIR = "thumbnails"
+# Page images of web jobs that do not fit in RAM scratch, one subdirectory per
+# job so exports never mix runs
+IMAGES_DIR = "images"
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Scratch directories reported by the metrics endpoint
+SCRATCH_DIRS = [IMAGES_DIR, "temp_spreads", THUMBNAILS_DIR] + ([FAST_SCRATCH_DIR] if FAST_SCRATCH_DIR else [])
+
+
+def job_outcome(success, cancel_token):
+    """Classify a finished in-process job for metrics"""
+    if cancel_token.cancelled:
+        return 'cancelled'
+    return 'success' if success else 'failed'
+
+
+def directory_size(path):
+    """Total size in bytes of all files below path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class JobPages:
+    """Page files of one fetcher run in arrival order, followed by exports"""
+    
+    def __init__(self, scratch):
+        self.scratch = scratch
+        self.pages = []
+        self.finished = False
+        self.condition = threading.Condition()
+    
+    def add(self, page_number, image_path):
+        with self.condition:
+            self.pages.append((page_number, image_path))
+            self.condition.notify_all()
+    
+    def finish(self):
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+    
+    def follow(self):
+        """Yield (page number, image path) pairs, waiting for new pages until the run ends"""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.pages) and not self.finished:
+                    self.condition.wait()
+                if index >= len(self.pages):
+                    return
+                page = self.pages[index]
+            index += 1
+            yield page
+
+
 class ScriptRunner:
     def __init__(self):
         self.running_processes = {}
         self.process_outputs = {}
         self.running_fetchers = {}  # For CEWE fetcher instances
         self.running_spreads = {}   # For spreads creator instances
+        self.cancel_tokens = {}     # Cancellation tokens for in-process jobs
+        self.preview_jobs = {}      # Current page-preview job id per script
+        self.job_pages = {}         # Fetched page files per job id, for exports
+        self.traces = {}            # Span tracer of the latest run per script
         self.last_created_pdf = None  # Track the last created PDF
     
     def run_script(self, script_name, script_path, options=None):
@@ -71,22 +174,17 @@ class ScriptRunner:
             if options:
                 cmd.extend(options)
             
-            # Start process
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                cwd=os.getcwd()
-            )
-            
-            self.running_processes[script_name] = process
+            # No process until the job gets an admission slot
+            cancel_token = CancellationToken()
+            self.running_processes[script_name] = None
+            self.cancel_tokens[script_name] = cancel_token
             self.process_outputs[script_name] = []
+            self.traces[script_name] = Tracer(script_name)
             
-            # Start output streaming thread
+            # Start script thread
             threading.Thread(
-                target=self._stream_output,
-                args=(script_name, process),
+                target=self._run_script_thread,
+                args=(script_name, cmd, cancel_token),
                 daemon=True
             ).start()
             
@@ -96,7 +194,8 @@ class ScriptRunner:
             logger.error(f"Error running script {script_name}: {str(e)}")
             return False, f"Error: {str(e)}"
     
-    def run_cewe_fetcher(self, script_name, photobook_url, start_page=1, end_page=None, width=1080, filename=None):
+    def run_cewe_fetcher(self, script_name, photobook_url, start_page=1, end_page=None, width=1080, filename=None,
+                         profile=False, estimate=None):
         """Run CEWE fetcher directly"""
         if not CEWE_FETCHER_AVAILABLE:
             return False, "CEWE fetcher not available. Install required dependencies."
@@ -105,19 +204,37 @@ class ScriptRunner:
             return False, "CEWE fetcher is already running"
         
         try:
+            from cewe_fetcher import CEWEPhotoBookFetcher
+            
             # Create fetcher instance
+            cancel_token = CancellationToken()
+            job_id = self._new_page_job(script_name)
             fetcher = CEWEPhotoBookFetcher(
                 photobook_url=photobook_url,
                 start_page=start_page,
                 end_page=end_page,
-                target_width=width
+                target_width=width,
+                cancel_token=cancel_token,
+                on_page_fetched=self._preview_callback(script_name, job_id),
+                tracer=Tracer(script_name)
             )
+            fetcher.job_id = job_id
+            fetcher.scratch = self.job_pages[job_id].scratch
             
             # Store custom filename for later use
             if filename:
                 fetcher.custom_filename = filename
+            fetcher.profile = profile
+            
+            # Skip extraction and page detection if /analyze already did it
+            analysis = book_analyzer.get_result(photobook_url)
+            if analysis:
+                fetcher.load_analysis(analysis)
+            fetcher.estimate = estimate
             
             self.running_fetchers[script_name] = fetcher
+            self.cancel_tokens[script_name] = cancel_token
+            self.traces[script_name] = fetcher.tracer
             self.process_outputs[script_name] = []
             
             # Start fetcher thread
@@ -133,7 +250,8 @@ class ScriptRunner:
             logger.error(f"Error running CEWE fetcher {script_name}: {str(e)}")
             return False, f"Error: {str(e)}"
     
-    def run_spreads_creator(self, script_name, input_pdf, start_spread_page=2, dpi=300):
+    def run_spreads_creator(self, script_name, input_pdf, start_spread_page=2, dpi=300, profile=False,
+                            estimate=None):
         """Run spreads creator directly"""
         if not SPREADS_CREATOR_AVAILABLE:
             return False, "Spreads creator not available."
@@ -146,15 +264,24 @@ class ScriptRunner:
             base_name = os.path.splitext(os.path.basename(input_pdf))[0]
             output_pdf = f"output/{base_name}_spreads.pdf"
             
+            from create_spreads import PDFSpreadCreator
+            
             # Create spreads creator instance
+            cancel_token = CancellationToken()
             creator = PDFSpreadCreator(
                 input_pdf=input_pdf,
                 output_pdf=output_pdf,
                 start_spread_page=start_spread_page,
-                dpi=dpi
+                dpi=dpi,
+                cancel_token=cancel_token,
+                tracer=Tracer(script_name)
             )
             
+            creator.profile = profile
+            creator.estimate = estimate
             self.running_spreads[script_name] = creator
+            self.cancel_tokens[script_name] = cancel_token
+            self.traces[script_name] = creator.tracer
             self.process_outputs[script_name] = []
             
             # Start creator thread
@@ -170,8 +297,69 @@ class ScriptRunner:
             logger.error(f"Error running spreads creator {script_name}: {str(e)}")
             return False, f"Error: {str(e)}"
     
+    def _new_page_job(self, script_name):
+        """Start a new page job for a script and return its id"""
+        # Previews and pages from the previous run of this script are no longer shown
+        previous_job = self.preview_jobs.get(script_name)
+        if previous_job:
+            previous_pages = self.job_pages.pop(previous_job, None)
+            if previous_pages:
+                previous_pages.finish()
+                previous_pages.scratch.cleanup()
+            shutil.rmtree(os.path.join(THUMBNAILS_DIR, previous_job), ignore_errors=True)
+        
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(os.path.join(THUMBNAILS_DIR, job_id), exist_ok=True)
+        self.preview_jobs[script_name] = job_id
+        self.job_pages[job_id] = JobPages(JobScratch('fetcher', IMAGES_DIR, job_id=job_id))
+        return job_id
+    
+    def _preview_callback(self, script_name, job_id):
+        """Create a callback that records each fetched page, thumbnails it and pushes it to the UI"""
+        job_dir = os.path.join(THUMBNAILS_DIR, job_id)
+        pages = self.job_pages[job_id]
+        
+        def on_page_fetched(page_number, image_path):
+            pages.add(page_number, image_path)
+            
+            from cewe_fetcher import make_thumbnail
+            make_thumbnail(image_path, os.path.join(job_dir, f"page_{page_number:03d}.jpg"))
+            socketio.emit('page_preview', {
+                'script': script_name,
+                'job_id': job_id,
+                'page': page_number,
+                'url': f"/thumbnail/{job_id}/{page_number}",
+                'timestamp': datetime.now().strftime('%H:%M:%S')
+            })
+        
+        return on_page_fetched
+    
+    def _wait_for_slot(self, script_name, cancel_token, emit_output, estimate=None):
+        """Wait for an admission slot; returns False if the job was stopped while queued
+
+        Queued jobs with a smaller estimate start first.
+        """
+        if estimate:
+            from cost_estimator import describe_estimate
+            emit_output(f"📊 Estimated cost: {describe_estimate(estimate)}")
+        if admission.acquire(cancel_token, on_queued=lambda: emit_output(
+                "⏳ Server busy, job queued until a running job finishes"),
+                cost=estimate['seconds'] if estimate else None):
+            return True
+        
+        emit_output("🛑 Job stopped while queued")
+        socketio.emit('script_finished', {
+            'script': script_name,
+            'return_code': 1,
+            'timestamp': datetime.now().strftime('%H:%M:%S')
+        })
+        return False
+    
     def _run_cewe_fetcher_thread(self, script_name, fetcher):
         """Run CEWE fetcher in a separate thread"""
+        started = time.time()
+        outcome = 'error'
+        slot_acquired = False
         try:
             # Redirect stdout to capture prints
             import io
@@ -187,6 +375,11 @@ class ScriptRunner:
                     'timestamp': datetime.now().strftime('%H:%M:%S')
                 })
             
+            slot_acquired = self._wait_for_slot(script_name, fetcher.cancel_token, emit_output, fetcher.estimate)
+            if not slot_acquired:
+                outcome = 'cancelled'
+                return
+            
             # Override print function temporarily
             original_print = print
             def custom_print(*args, **kwargs):
@@ -201,26 +394,32 @@ class ScriptRunner:
             try:
                 # Run the fetcher with custom filename if provided
                 custom_filename = getattr(fetcher, 'custom_filename', None)
-                success = fetcher.run(custom_filename)
+                profiler = JobProfiler() if fetcher.profile else contextlib.nullcontext()
+                with profiler, fetcher.tracer.span('job', url=fetcher.photobook_url):
+                    success = fetcher.run(custom_filename)
+                book_analyzer.remember_native_width(fetcher.photobook_url, fetcher.native_width)
+                
+                if fetcher.profile:
+                    base = profile_output_base(fetcher.output_path or os.path.join("output", script_name))
+                    for path in profiler.save(base):
+                        emit_output(f"📈 Profile written: {path}")
+                outcome = job_outcome(success, fetcher.cancel_token)
+                emit_output(fetcher.scratch.summary())
                 
                 if success:
                     emit_output("🎉 CEWE photo book fetched successfully!")
                     
-                    # Find the created PDF
-                    output_dir = "output"
-                    pdf_files = glob.glob(os.path.join(output_dir, "cewe_photobook_*.pdf"))
-                    if pdf_files:
-                        # Get the most recently created PDF
-                        latest_pdf = max(pdf_files, key=os.path.getctime)
-                        self.last_created_pdf = latest_pdf
-                        emit_output(f"📄 Created PDF: {latest_pdf}")
-                        
-                        # Emit special event for successful PDF creation
-                        socketio.emit('pdf_created', {
-                            'pdf_path': latest_pdf,
-                            'script': script_name,
-                            'timestamp': datetime.now().strftime('%H:%M:%S')
-                        })
+                    # The fetcher reports the (possibly reused) PDF it produced
+                    latest_pdf = fetcher.output_path
+                    self.last_created_pdf = latest_pdf
+                    emit_output(f"📄 Created PDF: {latest_pdf}")
+                    
+                    # Emit special event for successful PDF creation
+                    socketio.emit('pdf_created', {
+                        'pdf_path': latest_pdf,
+                        'script': script_name,
+                        'timestamp': datetime.now().strftime('%H:%M:%S')
+                    })
                     
                     socketio.emit('script_finished', {
                         'script': script_name,
@@ -247,12 +446,25 @@ class ScriptRunner:
                 'timestamp': datetime.now().strftime('%H:%M:%S')
             })
         finally:
-            # Clean up
-            if script_name in self.running_fetchers:
+            if slot_acquired:
+                admission.release()
+            metrics.JOB_DURATION_SECONDS.observe(time.time() - started, type='fetcher', outcome=outcome)
+            # Let exports that follow this job finish their archive
+            pages = self.job_pages.get(fetcher.job_id)
+            if pages:
+                pages.finish()
+            # Clean up (a stopped job may already have been replaced by a new one)
+            if self.running_fetchers.get(script_name) is fetcher:
                 del self.running_fetchers[script_name]
+                self.cancel_tokens.pop(script_name, None)
     
     def _run_spreads_creator_thread(self, script_name, creator):
         """Run spreads creator in a separate thread"""
+        import contextlib
+        
+        started = time.time()
+        outcome = 'error'
+        slot_acquired = False
         try:
             def emit_output(message):
                 self.process_outputs[script_name].append(message)
@@ -262,6 +474,11 @@ class ScriptRunner:
                     'timestamp': datetime.now().strftime('%H:%M:%S')
                 })
             
+            slot_acquired = self._wait_for_slot(script_name, creator.cancel_token, emit_output, creator.estimate)
+            if not slot_acquired:
+                outcome = 'cancelled'
+                return
+            
             # Override print function temporarily
             original_print = print
             def custom_print(*args, **kwargs):
@@ -275,7 +492,14 @@ class ScriptRunner:
             
             try:
                 # Run the creator
-                success = creator.run()
+                profiler = JobProfiler() if creator.profile else contextlib.nullcontext()
+                with profiler, creator.tracer.span('job', input_pdf=creator.input_pdf):
+                    success = creator.run()
+                
+                if creator.profile:
+                    for path in profiler.save(profile_output_base(creator.output_pdf)):
+                        emit_output(f"📈 Profile written: {path}")
+                outcome = job_outcome(success, creator.cancel_token)
                 
                 if success:
                     emit_output("🎉 Spreads created successfully!")
@@ -304,12 +528,66 @@ class ScriptRunner:
                 'timestamp': datetime.now().strftime('%H:%M:%S')
             })
         finally:
-            # Clean up
-            if script_name in self.running_spreads:
+            if slot_acquired:
+                admission.release()
+            metrics.JOB_DURATION_SECONDS.observe(time.time() - started, type='spreads', outcome=outcome)
+            # Clean up (a stopped job may already have been replaced by a new one)
+            if self.running_spreads.get(script_name) is creator:
                 del self.running_spreads[script_name]
+                self.cancel_tokens.pop(script_name, None)
+    
+    def _run_script_thread(self, script_name, cmd, cancel_token):
+        """Wait for an admission slot, then start the script and stream its output"""
+        def emit_output(message):
+            self.process_outputs[script_name].append(message)
+            socketio.emit('script_output', {
+                'script': script_name,
+                'output': message,
+                'timestamp': datetime.now().strftime('%H:%M:%S')
+            })
+        
+        slot_acquired = False
+        try:
+            slot_acquired = self._wait_for_slot(script_name, cancel_token, emit_output)
+            if not slot_acquired:
+                return
+            
+            # Start process
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                cwd=os.getcwd()
+            )
+            if self.cancel_tokens.get(script_name) is cancel_token:
+                self.running_processes[script_name] = process
+            if cancel_token.cancelled:
+                # Stopped while the process was starting
+                process.terminate()
+            self._stream_output(script_name, process)
+            
+        except Exception as e:
+            logger.error(f"Error running script {script_name}: {str(e)}")
+            socketio.emit('script_error', {
+                'script': script_name,
+                'error': str(e),
+                'timestamp': datetime.now().strftime('%H:%M:%S')
+            })
+        finally:
+            if slot_acquired:
+                admission.release()
+            # Clean up (a stopped script may already have been replaced by a new one)
+            if self.cancel_tokens.get(script_name) is cancel_token:
+                self.running_processes.pop(script_name, None)
+                del self.cancel_tokens[script_name]
     
     def _stream_output(self, script_name, process):
         """Stream process output via websocket"""
+        started = time.time()
+        outcome = 'error'
+        span = self.traces[script_name].span('job', pid=process.pid)
+        span.__enter__()
         try:
             while True:
                 output = process.stdout.readline()
@@ -326,6 +604,7 @@ class ScriptRunner:
             
             # Process finished
             return_code = process.poll()
+            outcome = 'success' if return_code == 0 else 'failed'
             socketio.emit('script_finished', {
                 'script': script_name,
                 'return_code': return_code,
@@ -340,17 +619,20 @@ class ScriptRunner:
                 'timestamp': datetime.now().strftime('%H:%M:%S')
             })
         finally:
-            # Clean up
-            if script_name in self.running_processes:
-                del self.running_processes[script_name]
+            span.set(outcome=outcome)
+            span.__exit__(None, None, None)
+            metrics.JOB_DURATION_SECONDS.observe(time.time() - started, type='script', outcome=outcome)
     
     def stop_script(self, script_name):
         """Stop a running script or fetcher"""
         # Try to stop regular script first
         if script_name in self.running_processes:
             try:
-                self.running_processes[script_name].terminate()
-                del self.running_processes[script_name]
+                # A queued script has no process yet; its token stops the wait
+                self.cancel_tokens.pop(script_name).cancel()
+                process = self.running_processes.pop(script_name)
+                if process:
+                    process.terminate()
                 return True, "Script stopped"
             except Exception as e:
                 return False, f"Error stopping script: {str(e)}"
@@ -358,8 +640,9 @@ class ScriptRunner:
         # Try to stop CEWE fetcher
         if script_name in self.running_fetchers:
             try:
-                # There's no clean way to stop the fetcher mid-execution
-                # But we can remove it from tracking
+                # Signal the fetcher; it aborts the in-flight download and
+                # stops before the next page
+                self.cancel_tokens.pop(script_name).cancel()
                 del self.running_fetchers[script_name]
                 return True, "CEWE fetcher stopped"
             except Exception as e:
@@ -368,6 +651,7 @@ class ScriptRunner:
         # Try to stop spreads creator
         if script_name in self.running_spreads:
             try:
+                self.cancel_tokens.pop(script_name).cancel()
                 del self.running_spreads[script_name]
                 return True, "Spreads creator stopped"
             except Exception as e:
@@ -385,12 +669,236 @@ class ScriptRunner:
         """Get accumulated output for a script"""
         return self.process_outputs.get(script_name, [])
     
+    def get_trace(self, script_name):
+        """Get the tracer of the latest run of a script"""
+        return self.traces.get(script_name)
+    
     def get_latest_pdf(self):
         """Get the path to the most recently created PDF"""
         return self.last_created_pdf
 
+class BookAnalyzer:
+    """Background analysis of photo book URLs, cached per URL"""
+    
+    CACHE_TTL = 15 * 60  # Share pages rarely change within a session
+    
+    def __init__(self):
+        self.results = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def analyze(self, photobook_url, width=1080):
+        """Start analysing a URL in the background, or return the cached state"""
+        with self.lock:
+            # Drop stale entries so the cache doesn't grow without bound
+            now = time.time()
+            for url, cached in list(self.results.items()):
+                if cached['status'] != 'pending' and now - cached['timestamp'] >= self.CACHE_TTL:
+                    del self.results[url]
+            
+            entry = self.results.get(photobook_url)
+            # A request for the native width needs an analysis that probed it
+            probed = width != 'native' or (entry and entry['result'] and entry['result'].get('native_width'))
+            if entry and (entry['status'] == 'pending' or
+                          (time.time() - entry['timestamp'] < self.CACHE_TTL and probed)):
+                return entry
+            
+            entry = {'status': 'pending', 'result': None, 'timestamp': time.time()}
+            self.results[photobook_url] = entry
+        
+        threading.Thread(
+            target=self._analyze_thread,
+            args=(photobook_url, width, entry),
+            daemon=True
+        ).start()
+        return entry
+    
+    def get_result(self, photobook_url):
+        """Return a finished, still-fresh analysis for the URL, if any"""
+        entry = self.results.get(photobook_url)
+        if (entry and entry['status'] == 'done' and
+                time.time() - entry['timestamp'] < self.CACHE_TTL):
+            self.hits += 1
+            return entry['result']
+        self.misses += 1
+        return None
+    
+    def remember_native_width(self, photobook_url, native_width):
+        """Record the native width a job discovered in the URL's cached analysis"""
+        entry = self.results.get(photobook_url)
+        if native_width and entry and entry['status'] == 'done' and entry['result']:
+            entry['result'] = dict(entry['result'], native_width=native_width)
+    
+    def peek(self, photobook_url):
+        """Finished, still-fresh analysis result (not counted as a cache lookup)"""
+        entry = self.results.get(photobook_url)
+        if (entry and entry['status'] == 'done' and entry['result'] and
+                time.time() - entry['timestamp'] < self.CACHE_TTL):
+            return entry['result']
+        return None
+    
+    def _analyze_thread(self, photobook_url, width, entry):
+        """Run extraction and page-count detection in a separate thread"""
+        try:
+            from cewe_fetcher import CEWEPhotoBookFetcher
+            fetcher = CEWEPhotoBookFetcher(photobook_url=photobook_url, target_width=width)
+            result = fetcher.analyze()
+            entry['result'] = result
+            entry['status'] = 'done' if result else 'error'
+        except Exception as e:
+            logger.error(f"Error analysing {photobook_url}: {str(e)}")
+            entry['status'] = 'error'
+        entry['timestamp'] = time.time()
+        
+        socketio.emit('book_analyzed', {
+            'url': photobook_url,
+            'status': entry['status'],
+            'result': entry['result'],
+            'timestamp': datetime.now().strftime('%H:%M:%S')
+        })
+
+def is_admin_request():
+    """Whether the request carries the configured admin token"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def parse_width_option(value):
+    """Job width from a request: a pixel count, or 'native' to probe the book's
+    native resolution; None if invalid"""
+    if value == 'native':
+        return value
+    try:
+        width = int(value)
+    except (TypeError, ValueError):
+        return None
+    return width if width > 0 else None
+
+
+def job_analysis(analysis, width, start_page=1, end_page=None):
+    """An analysis result with its size and cost estimates rescaled to a job's
+    page range and width
+
+    The analysis covers every page at the width it was run with. A native
+    width is only known once it has been probed; until then the analysed
+    width stands in for it.
+    """
+    if not analysis:
+        return analysis
+    last_page = analysis['end_page']
+    if end_page:
+        last_page = min(end_page, last_page)
+    page_count = max(0, last_page - start_page + 1)
+    
+    if width == 'native':
+        width = analysis.get('native_width') or analysis['width']
+    # JPEG size grows roughly with pixel count
+    pixel_scale = (width / analysis['width']) ** 2 if analysis['width'] else 1.0
+    
+    page_bytes = analysis.get('estimated_page_bytes')
+    if page_bytes:
+        page_bytes = int(page_bytes * pixel_scale)
+    result = dict(analysis, page_count=page_count, width=width,
+                  estimated_page_bytes=page_bytes,
+                  estimated_size=page_bytes * page_count if page_bytes else None)
+    if analysis.get('estimate'):
+        from cost_estimator import scale_estimate
+        result['estimate'] = scale_estimate(analysis['estimate'], page_count, pixel_scale)
+    return result
+
+
+def wants_profile(data):
+    """Read the admin-only 'profile' job option; returns (profile, error response)"""
+    if not data.get('profile'):
+        return False, None
+    if not is_admin_request():
+        return False, (jsonify({'success': False, 'message': 'Profiling requires admin access'}), 403)
+    if profiler_busy():
+        return False, (jsonify({'success': False,
+                                'message': 'Another job is being profiled, try again when it has finished'}), 409)
+    return True, None
+
+
+def admission_error(estimate=None):
+    """Fast 503 response if the worker is not accepting jobs, else None
+
+    estimate is the job's pre-flight cost estimate, if one is known.
+    """
+    status = admission.status(estimate['seconds'] if estimate else None)
+    if status['accepting']:
+        return None
+    
+    for reason in status['reasons']:
+        metrics.ADMISSION_REJECTIONS.inc(reason=reason)
+    response = jsonify({
+        'success': False,
+        'message': 'Server is busy, please try again later',
+        'reasons': status['reasons']
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response
+
+def estimate_spreads_job(input_pdf, dpi):
+    """Pre-flight cost of a spreads job, or None if the PDF cannot be read"""
+    if not SPREADS_CREATOR_AVAILABLE:
+        return None
+    try:
+        import fitz
+        from cost_estimator import estimate_spreads
+        with fitz.open(input_pdf) as doc:
+            return estimate_spreads(len(doc), dpi)
+    except Exception as e:
+        logger.warning(f"Could not estimate spreads job for {input_pdf}: {e}")
+        return None
+
 # Global script runner instance
 script_runner = ScriptRunner()
+book_analyzer = BookAnalyzer()
+admission = AdmissionController()
+
+
+def _hit_ratio(hits, misses):
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+metrics.JOBS_RUNNING.set_function(lambda: {
+    ('fetcher',): len(script_runner.running_fetchers),
+    ('spreads',): len(script_runner.running_spreads),
+    ('script',): len(script_runner.running_processes),
+})
+metrics.JOBS_QUEUED.set_function(lambda: {(): admission.queued})
+metrics.SCRATCH_BYTES.set_function(lambda: {
+    (directory,): directory_size(directory) for directory in SCRATCH_DIRS
+})
+def _cache_hit_ratios():
+    ratios = {('analysis',): _hit_ratio(book_analyzer.hits, book_analyzer.misses)}
+    # Don't import requests just for a scrape; no job has run if it isn't loaded
+    http_client = sys.modules.get('http_client')
+    if http_client:
+        dns = http_client.get_pool_stats()['dns_cache']
+        ratios[('dns',)] = _hit_ratio(dns['hits'], dns['misses'])
+    raster_cache = sys.modules.get('raster_cache')
+    if raster_cache:
+        raster = raster_cache.get_stats()
+        ratios[('raster',)] = _hit_ratio(raster['hits'], raster['misses'])
+    return ratios
+
+
+metrics.CACHE_HIT_RATIO.set_function(_cache_hit_ratios)
+def _job_scratch_bytes():
+    usages = get_scratch_usage()
+    return {
+        ('ram',): sum(usage['fast_bytes'] for usage in usages),
+        ('disk',): sum(usage['disk_bytes'] for usage in usages),
+    }
+
+
+metrics.JOB_SCRATCH_BYTES.set_function(_job_scratch_bytes)
+metrics.PIXEL_MEMORY_BYTES.set_function(lambda: {
+    (state,): get_pixel_memory().stats()[f'{state}_bytes'] for state in ('budget', 'in_use', 'peak')
+})
 
 @app.route('/')
 def index():
@@ -406,6 +914,10 @@ def run_script():
     script_name = data.get('script')
     options = data.get('options', [])
     
+    error = admission_error()
+    if error:
+        return error
+    
     if script_name == 'photobook':
         success, message = script_runner.run_script('photobook', './run_web.sh', options)
     elif script_name == 'spreads':
@@ -425,7 +937,7 @@ def run_cewe_fetcher():
     end_page = data.get('end_page')
     if end_page:
         end_page = int(end_page)
-    width = int(data.get('width', 1080))
+    width = parse_width_option(data.get('width', 1080))
     filename = data.get('filename') # Get custom filename
     
     if not photobook_url:
@@ -434,17 +946,61 @@ def run_cewe_fetcher():
     if not photobook_url.startswith('http'):
         return jsonify({'success': False, 'message': 'Invalid URL format'})
     
+    if width is None:
+        return jsonify({'success': False, 'message': "Width must be a number of pixels or 'native'"})
+    
+    profile, error = wants_profile(data)
+    if error:
+        return error
+    
+    # Admit on what this job will cost, not on the whole book at the analysed width
+    analysis = job_analysis(book_analyzer.peek(photobook_url), width, start_page, end_page)
+    estimate = analysis and analysis.get('estimate')
+    error = admission_error(estimate)
+    if error:
+        return error
+    
     success, message = script_runner.run_cewe_fetcher(
         'cewe_fetcher', 
         photobook_url, 
         start_page, 
         end_page, 
         width,
-        filename # Pass filename to the runner
+        filename, # Pass filename to the runner
+        profile,
+        estimate
     )
     
     return jsonify({'success': success, 'message': message})
 
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    """Analyse a photo book URL ahead of starting the fetcher"""
+    if not CEWE_FETCHER_AVAILABLE:
+        return jsonify({'success': False, 'message': 'CEWE fetcher not available.'})
+    
+    data = request.json
+    photobook_url = data.get('url', '').strip()
+    width = parse_width_option(data.get('width', 1080))
+    start_page = int(data.get('start_page') or 1)
+    end_page = data.get('end_page')
+    if end_page:
+        end_page = int(end_page)
+    
+    if not photobook_url.startswith('http'):
+        return jsonify({'success': False, 'message': 'Invalid URL format'})
+    
+    if width is None:
+        return jsonify({'success': False, 'message': "Width must be a number of pixels or 'native'"})
+    
+    entry = book_analyzer.analyze(photobook_url, width)
+    
+    return jsonify({
+        'success': True,
+        'status': entry['status'],
+        'result': job_analysis(entry['result'], width, start_page, end_page)
+    })
+
 @app.route('/run_spreads_creator', methods=['POST'])
 def run_spreads_creator():
     """Run spreads creator with specified PDF"""
@@ -460,11 +1016,22 @@ def run_spreads_creator():
     if not os.path.exists(input_pdf):
         return jsonify({'success': False, 'message': 'Input PDF file not found'})
     
+    profile, error = wants_profile(data)
+    if error:
+        return error
+    
+    estimate = estimate_spreads_job(input_pdf, dpi)
+    error = admission_error(estimate)
+    if error:
+        return error
+    
     success, message = script_runner.run_spreads_creator(
         'spreads_creator',
         input_pdf,
         start_spread_page,
-        dpi
+        dpi,
+        profile,
+        estimate
     )
     
     return jsonify({'success': success, 'message': message})
@@ -527,6 +1094,100 @@ def download_file(filename):
     else:
         return jsonify({'error': 'File not found'}), 404
 
+@app.route('/thumbnail/<job_id>/<int:page>')
+def thumbnail(job_id, page):
+    """Serve a page preview; job ids are unique so previews never change"""
+    if not job_id.isalnum():
+        return jsonify({'error': 'Invalid job id'}), 400
+    
+    file_path = os.path.join(os.getcwd(), THUMBNAILS_DIR, job_id, f"page_{page:03d}.jpg")
+    
+    if os.path.exists(file_path):
+        return send_file(file_path, mimetype='image/jpeg', max_age=365 * 24 * 3600)
+    else:
+        return jsonify({'error': 'File not found'}), 404
+
+@app.route('/export/<job_id>/<archive_format>')
+def export_pages(job_id, archive_format):
+    """Stream a fetcher job's page images as a ZIP or CBZ
+
+    Pages are sent as soon as they are fetched, so the download starts with
+    the first page and follows a running job until it finishes.
+    """
+    if archive_format not in ARCHIVE_FORMATS:
+        return jsonify({'error': 'Unknown archive format'}), 404
+    
+    pages = script_runner.job_pages.get(job_id)
+    if not pages:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = Response(iter_archive(pages.follow()), mimetype=ARCHIVE_FORMATS[archive_format])
+    response.headers['Content-Disposition'] = f'attachment; filename=photobook_{job_id}.{archive_format}'
+    # Let nginx pass each page on as it is written
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/http_pool_stats')
+def http_pool_stats():
+    """Connection pool and rate governor statistics for the shared HTTP client"""
+    from http_client import get_pool_stats
+    
+    stats = get_pool_stats()
+    stats['rate_governors'] = get_rate_stats()
+    return jsonify(stats)
+
+@app.route('/trace/<script_name>')
+def download_trace(script_name):
+    """Download the latest run's span tree in Chrome trace-event format"""
+    tracer = script_runner.get_trace(script_name)
+    if not tracer:
+        return jsonify({'error': 'No trace recorded'}), 404
+    
+    response = jsonify(tracer.to_chrome_trace())
+    response.headers['Content-Disposition'] = f'attachment; filename={script_name}_trace.json'
+    return response
+
+@app.route('/trace/<script_name>/waterfall')
+def trace_waterfall(script_name):
+    """Spans of the latest run, flattened for the UI waterfall"""
+    tracer = script_runner.get_trace(script_name)
+    if not tracer:
+        return jsonify({'spans': []})
+    return jsonify({'spans': tracer.to_waterfall()})
+
+@app.route('/scratch_stats')
+def scratch_stats():
+    """Scratch space usage of jobs whose intermediate files are still around"""
+    return jsonify({
+        'fast_scratch_dir': FAST_SCRATCH_DIR,
+        'jobs': get_scratch_usage()
+    })
+
+@app.route('/loop_stats')
+def loop_stats():
+    """Event loop lag percentiles; stacks of blocking code are admin-only"""
+    return jsonify(loop_monitor.stats(include_stacks=is_admin_request()))
+
+@app.route('/health')
+def health():
+    """Liveness check: the worker is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/ready')
+def ready():
+    """Readiness check: job load, CPU saturation and scratch space; 503 while shedding load"""
+    status = admission.status()
+    response = jsonify(status)
+    if not status['accepting']:
+        response.status_code = 503
+        response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render_all(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/list_files')
 def list_files():
     """List available files for download"""
@@ -575,6 +1236,8 @@ def create_app():
     else:
         print("⚠️ Spreads creator not available")
     
+    print(f"⏱️ Web interface imported in {(time.perf_counter() - _import_started) * 1000:.0f} ms")
+    
     return app
 
 if __name__ == '__main__':
@@ -585,6 +1248,8 @@ if __name__ == '__main__':
     print("🔧 Make sure to run this in the same directory as your scripts")
     print("⚠️  Running in development mode - use gunicorn for production")
     
+    threading.Thread(target=prewarm_imports, daemon=True).start()
+    
     # Allow unsafe Werkzeug for development
     socketio.run(app, host='0.0.0.0', port=4200, debug=False, allow_unsafe_werkzeug=True)
 